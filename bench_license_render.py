@@ -0,0 +1,91 @@
+"""
+Micro-benchmarks for the license card renderer.
+
+    python bench_license_render.py [gradients] [encodings]
+"""
+from __future__ import annotations
+
+import io
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+from PIL import Image, ImageDraw
+
+from license_render import CardEncoding, CardSpec, draw_card, encode_card, vertical_gradient, warm_renderer
+
+
+def _loop_gradient(size, start, end):
+    # the per-row ImageDraw.line loop create_license_image used before license_render
+    w, h = size
+    img = Image.new("RGBA", (w, h), (0, 0, 0, 0))
+    d = ImageDraw.Draw(img)
+    for y in range(h):
+        t = y / h
+        r = int(start[0] + (end[0] - start[0]) * t)
+        g = int(start[1] + (end[1] - start[1]) * t)
+        b = int(start[2] + (end[2] - start[2]) * t)
+        d.line((0, y, w, y), fill=(max(0, min(255, r)), max(0, min(255, g)), max(0, min(255, b))))
+    return img
+
+
+def bench_gradients(number: int = 50):
+    start, end = (150, 180, 220), (190, 230, 240)
+    print(f"{'size':>12} {'loop (ms)':>10} {'numpy (ms)':>11} {'speedup':>8}  identical")
+    for scale in (1, 2, 4):
+        size = (820 * scale, 520 * scale)
+        loop_s = timeit.timeit(lambda: _loop_gradient(size, start, end), number=number) / number
+        np_s = timeit.timeit(lambda: vertical_gradient(size, start, end), number=number) / number
+        same = _loop_gradient(size, start, end).tobytes() == vertical_gradient(size, start, end).tobytes()
+        print(
+            f"{size[0]:>5}x{size[1]:<6} {loop_s * 1000:>10.2f} {np_s * 1000:>11.2f} "
+            f"{loop_s / np_s:>7.1f}x  {same}"
+        )
+
+
+def _sample_cards():
+    # a noisy 420px headshot stands in for a real Roblox avatar (flat colours compress unrealistically well)
+    buf = io.BytesIO()
+    Image.merge("RGB", [Image.effect_noise((420, 420), s) for s in (40, 60, 80)]).save(buf, "PNG")
+    avatar = buf.getvalue()
+
+    issued = datetime(2026, 1, 1)
+    for license_type, days in (("provisional", 3), ("official", 150)):
+        spec = CardSpec.build(
+            "LakeviewResident", "Jordan Example", 24, "1420 Harbor Rd, Lakeview", "Hazel", "5'11",
+            issued, issued + timedelta(days=days), "LKV-004217", license_type,
+        )
+        yield license_type, draw_card(spec, avatar)
+
+
+def bench_encodings(number: int = 5):
+    warm_renderer()
+    options = [
+        ("png (default, level 6)", CardEncoding()),
+        ("png level 1", CardEncoding(compress_level=1)),
+        ("png level 3", CardEncoding(compress_level=3)),
+        ("png level 9", CardEncoding(compress_level=9)),
+        ("png-palette 256", CardEncoding(format="png-palette")),
+        ("png-palette 128", CardEncoding(format="png-palette", colors=128)),
+        ("webp lossless m0", CardEncoding(format="webp", method=0)),
+        ("webp lossless m4", CardEncoding(format="webp", method=4)),
+    ]
+    print(f"{'card':<12} {'encoding':<24} {'bytes':>9} {'ms':>8}")
+    for license_type, card in _sample_cards():
+        for label, enc in options:
+            data = encode_card(card, enc)
+            ms = timeit.timeit(lambda: encode_card(card, enc), number=number) / number * 1000
+            print(f"{license_type:<12} {label:<24} {len(data):>9} {ms:>8.1f}")
+
+
+BENCHES = {
+    "gradients": bench_gradients,
+    "encodings": bench_encodings,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHES)
+    for name in names:
+        print(f"== {name} ==")
+        BENCHES[name]()
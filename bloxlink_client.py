@@ -0,0 +1,139 @@
+"""
+Shared Bloxlink HTTP client for webhook.py and cogs/Bloxlink.py.
+
+Concurrent lookups for the same key (guild, discord_id) are collapsed into
+one upstream request whose result every caller shares (SingleFlight), and all
+requests draw from a token bucket that a 429 empties and pauses for the
+response's Retry-After, so a verification wave backs off together instead of
+each caller retrying into more 429s.
+"""
+from __future__ import annotations
+
+import asyncio
+import email.utils
+import logging
+import time
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+import aiohttp
+
+log = logging.getLogger("bloxlink")
+
+
+class SingleFlight:
+    """At most one in-flight call per key; later callers await the same result (or exception)."""
+
+    def __init__(self):
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self.coalesced += 1
+        # shield: one caller giving up (timeout/disconnect) must not cancel the others' request
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved when every caller went away
+
+
+class TokenBucket:
+    """`rate` requests/second with bursts up to `capacity`; `pause()` stops everyone until a deadline."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()  # FIFO: waiters are served in arrival order
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+
+
+def retry_after_seconds(resp: aiohttp.ClientResponse, default: float = 1.0) -> float:
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        # HTTP-date form
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class BloxlinkClient:
+    """
+    GETs against api.blox.link through SingleFlight + TokenBucket over the
+    caller's ClientSession. `get()` returns (status, parsed JSON or None); a
+    429 is retried after its Retry-After up to `max_attempts` times as long as
+    the wait is under `max_wait`, otherwise it is returned to the caller.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        rate: float = 5.0,
+        burst: float = 10.0,
+        max_attempts: int = 3,
+        max_wait: float = 30.0,
+    ):
+        self.session = session
+        self.bucket = TokenBucket(rate, burst)
+        self.flight = SingleFlight()
+        self.max_attempts = max_attempts
+        self.max_wait = max_wait
+        self.requests = 0
+        self.throttled = 0
+
+    async def get(self, key: Hashable, url: str, headers: Optional[dict] = None) -> tuple[int, Any]:
+        return await self.flight.do(key, lambda: self._request(url, headers))
+
+    async def _request(self, url: str, headers: Optional[dict]) -> tuple[int, Any]:
+        attempt = 0
+        while True:
+            attempt += 1
+            await self.bucket.acquire()
+            self.requests += 1
+            async with self.session.get(url, headers=headers) as resp:
+                if resp.status == 429:
+                    self.throttled += 1
+                    wait = retry_after_seconds(resp)
+                    self.bucket.pause(wait)
+                    if attempt < self.max_attempts and wait <= self.max_wait:
+                        log.warning("Bloxlink 429; pausing lookups for %.1fs (attempt %s)", wait, attempt)
+                        continue
+                try:
+                    data = await resp.json(content_type=None)
+                except ValueError:
+                    data = None
+                return resp.status, data
@@ -5,6 +5,8 @@ from discord.ext import commands
 import aiohttp
 import asyncio
 
+from bloxlink_client import BloxlinkClient
+
 # Import the API Key AND the Guild ID (We keep GUILD_ID in case we need it later)
 from config import BLOXLINK_KEY, GUILD_ID
 
@@ -19,6 +21,8 @@ class Bloxlink(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.session = aiohttp.ClientSession()
+        # coalesces concurrent lookups for the same user and backs off together on 429s
+        self.client = BloxlinkClient(self.session)
 
     def cog_unload(self):
         asyncio.create_task(self.session.close())
@@ -37,28 +41,27 @@ class Bloxlink(commands.Cog):
         # 2. Construct the URL using the V4 Global format
         url = f"{BLOXLINK_API_URL_BASE}{user_id}"
 
-        async with self.session.get(url, headers=headers) as response:
-            try:
-                data = await response.json()
-            except aiohttp.ContentTypeError:
-                if response.status == 200:
-                    return {"status": "error", "message": "Received HTTP 200 but response was empty/malformed."}
-                else:
-                    return {"status": "error",
-                            "message": f"Non-JSON response (Status: {response.status}). The API server likely had an internal error."}
-
-            # 3. Handle V4 responses
-            if response.status == 200:
-                return data
-            elif response.status == 404:
-                # 404: User is not verified
-                return {"status": "error", "message": "User is not verified with Bloxlink (Status 404)."}
-            elif response.status == 401:
-                # 401: API Key is invalid or missing
-                return {"status": "error", "message": "Invalid Bloxlink API Key (Status 401). Using V4 structure."}
+        # global endpoint, so no guild in the single-flight key
+        status, data = await self.client.get((None, user_id), url, headers)
+        if not isinstance(data, dict):
+            if status == 200:
+                return {"status": "error", "message": "Received HTTP 200 but response was empty/malformed."}
             else:
-                api_msg = data.get("message", "No message provided.")
-                return {"status": "error", "message": f"API returned status {response.status}. Message: {api_msg}"}
+                return {"status": "error",
+                        "message": f"Non-JSON response (Status: {status}). The API server likely had an internal error."}
+
+        # 3. Handle V4 responses
+        if status == 200:
+            return data
+        elif status == 404:
+            # 404: User is not verified
+            return {"status": "error", "message": "User is not verified with Bloxlink (Status 404)."}
+        elif status == 401:
+            # 401: API Key is invalid or missing
+            return {"status": "error", "message": "Invalid Bloxlink API Key (Status 401). Using V4 structure."}
+        else:
+            api_msg = data.get("message", "No message provided.")
+            return {"status": "error", "message": f"API returned status {status}. Message: {api_msg}"}
 
     # The rest of the Bloxlink class remains unchanged...
     @commands.command(name="blxtest", aliases=["blxcheck", "bloxlink"])
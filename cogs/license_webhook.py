@@ -7,16 +7,30 @@ import math
 import json
 import time
 import logging
-import sqlite3
 import asyncio
+import uuid
 from datetime import datetime, timedelta
-from threading import Thread
 from typing import Optional
 
 # --- third-party ---
-import requests
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
-from flask import Flask, request, jsonify
+from aiohttp import web
+
+# license pipeline (repo root)
+from license_render import (
+    FONTS,
+    CardEncoding,
+    CardRenderer,
+    CardSpec,
+    default_render_workers,
+    render_card,
+    warm_renderer,
+)
+from license_metrics import METRICS
+from license_cache import AvatarCache, AvatarDownloader, AvatarTooLarge, RenderCache
+from license_store import LicenseReadCache, LicenseStore
+from license_sheets import SHEET_HEADER, LicenseSheetWriter
+from license_expiry import LicenseExpiryScheduler
+from license_discord import LicenseDiscordResolver, LogDigestPoster, RoleMutationQueue
 
 # Google Sheets
 import gspread
@@ -30,6 +44,22 @@ logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("license-bot")
 
 
+@web.middleware
+async def count_requests(request: web.Request, handler):
+    resource = request.match_info.route.resource
+    route = resource.canonical if resource is not None else "unmatched"
+    try:
+        resp = await handler(request)
+    except web.HTTPException as e:
+        METRICS.request(route, request.method, e.status)
+        raise
+    except Exception:
+        METRICS.request(route, request.method, 500)
+        raise
+    METRICS.request(route, request.method, resp.status)
+    return resp
+
+
 class LicenseSystem(commands.Cog):
     # ============================================================
     # CONSTANTS (IDS)
@@ -59,15 +89,112 @@ class LicenseSystem(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
 
-        # Flask server
-        self.app = Flask("license-system")
-        self._flask_thread: Optional[Thread] = None
+        # HTTP API (aiohttp, served on the bot's event loop)
+        self.app = web.Application(middlewares=[count_requests])
+        self._runner: Optional[web.AppRunner] = None
+
+        # strong refs for fire-and-forget tasks (Discord posting)
+        self._background_tasks: set[asyncio.Task] = set()
+
+        # card rendering (process pool; LICENSE_RENDER_WORKERS=0 renders on threads)
+        self.renderer = CardRenderer(int(os.getenv("LICENSE_RENDER_WORKERS", str(default_render_workers()))))
+
+        # avatar cache (memory LRU + on-disk content-addressed store)
+        self.CACHE_DIR = os.getenv("LICENSE_CACHE_DIR", os.path.join(".cache", "license"))
+        self.avatar_downloader = AvatarDownloader(
+            max_bytes=int(os.getenv("LICENSE_AVATAR_MAX_BYTES", str(5 * 1024 * 1024))),
+            per_host=int(os.getenv("LICENSE_AVATAR_PER_HOST", "8")),
+            timeout=float(os.getenv("LICENSE_AVATAR_TIMEOUT", "15")),
+        )
+        self.avatars = AvatarCache(
+            os.path.join(self.CACHE_DIR, "avatars"),
+            memory_budget=int(float(os.getenv("LICENSE_AVATAR_CACHE_MB", "64")) * 1024 * 1024),
+            disk_budget=int(float(os.getenv("LICENSE_AVATAR_CACHE_DISK_MB", "256")) * 1024 * 1024),
+            fresh_seconds=float(os.getenv("LICENSE_AVATAR_FRESH_SECONDS", "600")),
+            downloader=self.avatar_downloader,
+        )
+
+        # output encoding (LICENSE_CARD_FORMAT=png|png-palette|webp)
+        self.card_encoding = CardEncoding.from_env()
+
+        # finished cards keyed by a hash of all card inputs
+        self.render_cache = RenderCache(
+            os.path.join(self.CACHE_DIR, "renders"),
+            memory_budget=int(float(os.getenv("LICENSE_RENDER_CACHE_MB", "32")) * 1024 * 1024),
+            disk_budget=int(float(os.getenv("LICENSE_RENDER_CACHE_DISK_MB", "256")) * 1024 * 1024),
+        )
+
+        # POST /licenses/bulk: records processed concurrently per request
+        self.BULK_CONCURRENCY = max(1, int(os.getenv("LICENSE_BULK_CONCURRENCY", "8")))
+
+        # workforce.db (persistent WAL connection, opened in cog_load)
+        self.store = LicenseStore(
+            self.DB_PATH,
+            flush_window=float(os.getenv("LICENSE_DB_FLUSH_MS", "10")) / 1000,
+            batch_size=int(os.getenv("LICENSE_DB_BATCH", "100")),
+        )
+
+        # GET /license/{discord_id} and POST /licenses/lookup
+        self.license_cache = LicenseReadCache(self.store, capacity=int(os.getenv("LICENSE_READ_CACHE_SIZE", "10000")))
+        self.LOOKUP_MAX_IDS = int(os.getenv("LICENSE_LOOKUP_MAX_IDS", "1000"))
+
+        # async job mode (202 Accepted + worker pool)
+        self.ASYNC_JOBS_DEFAULT = os.getenv("LICENSE_ASYNC_JOBS", "").lower() in ("1", "true", "yes")
+        self.JOB_WORKERS = max(1, int(os.getenv("LICENSE_JOB_WORKERS", "4")))
+        self._job_queue: asyncio.Queue[str] = asyncio.Queue()
+        self._job_workers: list[asyncio.Task] = []
 
         # service account configuration
         self.SERVICE_ACCOUNT_FILE = os.getenv("GOOGLE_SERVICE_ACCOUNT_FILE", "service_account.json")
         self.SERVICE_ACCOUNT_JSON = os.getenv("GOOGLE_SERVICE_ACCOUNT_JSON")
         self.SPREADSHEET_ID = os.getenv("SPREADSHEET_ID")
 
+        # one coalescing writer for the Licenses worksheet
+        self.sheet_writer = LicenseSheetWriter(
+            self.store,
+            self._open_license_worksheet,
+            flush_interval=float(os.getenv("LICENSE_SHEET_FLUSH_SECONDS", "5")),
+            resync_interval=float(os.getenv("LICENSE_SHEET_RESYNC_SECONDS", "3600")),
+        )
+        # periodic table -> sheet reconcile (0 = only via !licensereconcile)
+        self.RECONCILE_HOURS = float(os.getenv("LICENSE_SHEET_RECONCILE_HOURS", "0"))
+        self._reconcile_task: Optional[asyncio.Task] = None
+
+        # role removal + notices when licenses expire (LICENSE_EXPIRY_ENABLED=0 turns it off)
+        self.EXPIRY_ENABLED = os.getenv("LICENSE_EXPIRY_ENABLED", "1").lower() in ("1", "true", "yes")
+        self.expiry = LicenseExpiryScheduler(
+            self.store,
+            self._expire_licenses,
+            window=float(os.getenv("LICENSE_EXPIRY_WINDOW_HOURS", "6")) * 3600,
+            batch_size=max(1, int(os.getenv("LICENSE_EXPIRY_BATCH", "10"))),
+            batch_interval=float(os.getenv("LICENSE_EXPIRY_BATCH_SECONDS", "5")),
+        )
+
+        # log channel / guild / roles resolved once and refreshed on gateway events
+        self.resolver = LicenseDiscordResolver(
+            bot,
+            self.LOG_CHANNEL_ID,
+            {
+                "prov_1": self.ROLE_PROV_1_ID,
+                "prov_2": self.ROLE_PROV_2_ID,
+                "official": self.ROLE_OFFICIAL_ID,
+            },
+            member_cache_size=int(os.getenv("LICENSE_MEMBER_CACHE_SIZE", "2048")),
+        )
+
+        # log-channel posts; LICENSE_LOG_DIGEST=1 packs bursts into multi-card messages
+        self.LOG_DIGEST = os.getenv("LICENSE_LOG_DIGEST", "").lower() in ("1", "true", "yes")
+        self.log_poster = LogDigestPoster(
+            self._log_channel,
+            threshold=max(2, int(os.getenv("LICENSE_LOG_DIGEST_THRESHOLD", "3"))),
+            max_per_message=int(os.getenv("LICENSE_LOG_DIGEST_MAX", "10")),
+            max_bytes=int(float(os.getenv("LICENSE_LOG_DIGEST_MAX_MB", "8")) * 1024 * 1024),
+        )
+
+        # one merged member.edit(roles=...) per member, serialised per guild
+        self._role_queues: dict[int, RoleMutationQueue] = {}
+        self.ROLE_EDIT_INTERVAL = float(os.getenv("LICENSE_ROLE_EDIT_INTERVAL", "0.25"))
+
         # register routes
         self._register_routes()
 
@@ -75,14 +202,162 @@ class LicenseSystem(commands.Cog):
     # COG LOAD/UNLOAD
     # -------------------------
     async def cog_load(self):
-        # Start Flask thread once
-        if self._flask_thread is None:
-            self._flask_thread = Thread(target=self._run_flask, daemon=True)
-            self._flask_thread.start()
-            log.info("✅ License Flask API started on 0.0.0.0:%s", os.getenv("PORT", "8080"))
+        # Warm and fork the render pool before this cog starts any thread or
+        # connection (aiosqlite, to_thread, Sheets): a forked child only gets
+        # the forking thread, so locks held elsewhere would stay held forever.
+        # Warming on the loop blocks it briefly, once, at load.
+        t0 = time.perf_counter()
+        warm_renderer()
+        for name, path in FONTS.resolved_paths().items():
+            if path:
+                log.info("License font %s -> %s", name, path)
+            else:
+                log.warning("License font %s not found; using Pillow's default bitmap font", name)
+        log.info("License card templates built in %.0f ms", (time.perf_counter() - t0) * 1000)
+
+        # workers inherit the fonts/templates already built
+        self.renderer.start()
+        if self.renderer.pooled:
+            log.info("License render pool started (%s workers)", self.renderer.workers)
+
+        await self.store.open()
+        self.sheet_writer.start()
+        if self.EXPIRY_ENABLED:
+            self.expiry.start()
+
+        await self.avatar_downloader.start()
+        await asyncio.to_thread(self.avatars.load)
+        await asyncio.to_thread(self.render_cache.load)
+
+        # Start the HTTP API once
+        if self._runner is None:
+            port = int(os.getenv("PORT", "8080"))
+            self._runner = web.AppRunner(self.app, access_log=None)
+            await self._runner.setup()
+            site = web.TCPSite(self._runner, host="0.0.0.0", port=port)
+            await site.start()
+            log.info("✅ License API started on 0.0.0.0:%s", port)
+
+        if not self._job_workers:
+            requeued = await self.store.requeue_interrupted_jobs()
+            for job_id in requeued:
+                self._job_queue.put_nowait(job_id)
+            self._job_workers = [
+                asyncio.create_task(self._job_worker(i)) for i in range(self.JOB_WORKERS)
+            ]
+            log.info("License job workers started (%s workers, %s jobs requeued)", self.JOB_WORKERS, len(requeued))
+
+        if self.RECONCILE_HOURS > 0 and self._reconcile_task is None:
+            self._reconcile_task = asyncio.create_task(self._reconcile_loop())
 
     async def cog_unload(self):
-        pass
+        # stop taking requests first, then drain/stop workers, then close resources
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+            log.info("License API stopped")
+
+        for t in self._job_workers:
+            t.cancel()
+        await asyncio.gather(*self._job_workers, return_exceptions=True)
+        self._job_workers = []
+
+        if self._reconcile_task is not None:
+            self._reconcile_task.cancel()
+            await asyncio.gather(self._reconcile_task, return_exceptions=True)
+            self._reconcile_task = None
+
+        await self.expiry.close()
+        for queue in self._role_queues.values():
+            await queue.close()
+        self._role_queues.clear()
+        await self.log_poster.close()
+        self.renderer.close()
+        await self.avatar_downloader.close()
+        await self.sheet_writer.close()
+        await self.store.close()
+
+    # ============================================================
+    # DISCORD CACHE INVALIDATION
+    # ============================================================
+    @commands.Cog.listener()
+    async def on_ready(self):
+        self.resolver.invalidate()
+        await self.resolver.ready()
+
+    def _invalidate_for_guild(self, guild: Optional[discord.Guild]):
+        if guild is None or self.resolver.guild is None or guild.id == self.resolver.guild.id:
+            self.resolver.invalidate()
+
+    @commands.Cog.listener()
+    async def on_guild_available(self, guild: discord.Guild):
+        self.resolver.invalidate()
+
+    @commands.Cog.listener()
+    async def on_guild_unavailable(self, guild: discord.Guild):
+        self._invalidate_for_guild(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild: discord.Guild):
+        self.resolver.invalidate()
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        self._invalidate_for_guild(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel: discord.abc.GuildChannel):
+        if channel.id == self.LOG_CHANNEL_ID:
+            self.resolver.invalidate()
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        if channel.id == self.LOG_CHANNEL_ID:
+            self.resolver.invalidate()
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel):
+        if after.id == self.LOG_CHANNEL_ID:
+            self.resolver.invalidate()
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role: discord.Role):
+        if role.id in self.resolver.role_ids.values():
+            self.resolver.invalidate()
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        if role.id in self.resolver.role_ids.values():
+            self.resolver.invalidate()
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        if after.id in self.resolver.role_ids.values():
+            self.resolver.invalidate()
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        self.resolver.member_updated(after)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        self.resolver.member_left(member.id)
+
+    async def _log_channel(self) -> Optional[discord.abc.Messageable]:
+        return (await self.resolver.ready()).channel
+
+    def _role_queue(self, guild: discord.Guild) -> RoleMutationQueue:
+        queue = self._role_queues.get(guild.id)
+        if queue is None:
+            queue = self._role_queues[guild.id] = RoleMutationQueue(
+                guild,
+                on_edited=self.resolver.member_updated,
+                min_interval=self.ROLE_EDIT_INTERVAL,
+            )
+        else:
+            # discord.py rebuilds Guild objects (e.g. guild_available after an outage); keep the queue and its pending edits
+            queue.guild = guild
+        return queue
 
     # ============================================================
     # GOOGLE SHEETS HELPERS
@@ -112,90 +387,56 @@ class LicenseSystem(commands.Cog):
         header = ws.row_values(1)
         if header:
             return
-        ws.append_row(
-            [
-                "Discord ID",
-                "Roblox Username",
-                "Roblox Display",
-                "Roleplay Name",
-                "License Number",
-                "License Type",
-                "License Code",
-                "Issued (UTC)",
-                "Expires (UTC)",
-                "Last Updated (UTC)",
-            ],
-            value_input_option="USER_ENTERED",
-        )
-
-    def upsert_license_to_sheet(self, license_info: dict):
-        for attempt in range(1, 4):
+        ws.append_row(SHEET_HEADER, value_input_option="USER_ENTERED")
+
+    def _open_license_worksheet(self) -> gspread.Worksheet:
+        gc = self._get_gspread_client()
+        sh = self._open_spreadsheet(gc)
+        ws = sh.worksheet(self.WORKSHEET_NAME)
+        self._ensure_header(ws)
+        return ws
+
+    async def _reconcile_loop(self):
+        while True:
+            await asyncio.sleep(self.RECONCILE_HOURS * 3600)
             try:
-                gc = self._get_gspread_client()
-                sh = self._open_spreadsheet(gc)
-                ws = sh.worksheet(self.WORKSHEET_NAME)
-                self._ensure_header(ws)
-
-                discord_id = str(license_info.get("discord_id", "")).strip()
-                if not discord_id:
-                    raise ValueError("license_info.discord_id missing")
-
-                now_utc = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-
-                row = [
-                    discord_id,
-                    str(license_info.get("roblox_username", "") or ""),
-                    str(license_info.get("roblox_display", "") or ""),
-                    str(license_info.get("roleplay_name", "") or ""),
-                    str(license_info.get("license_number", "") or ""),
-                    str(license_info.get("license_type", "") or ""),
-                    str(license_info.get("license_code", "") or ""),
-                    str(license_info.get("issued_at", "") or ""),
-                    str(license_info.get("expires_at", "") or ""),
-                    now_utc,
-                ]
-
-                col_a = ws.col_values(1)
-                target_row_idx = None
-                for idx, val in enumerate(col_a[1:], start=2):
-                    if str(val).strip() == discord_id:
-                        target_row_idx = idx
-                        break
-
-                if target_row_idx is None:
-                    ws.append_row(row, value_input_option="USER_ENTERED")
-                else:
-                    ws.update(f"A{target_row_idx}:J{target_row_idx}", [row], value_input_option="USER_ENTERED")
-
-                log.info("[Sheets] upserted license row for %s", discord_id)
-                return
-
+                counts = await self.sheet_writer.reconcile()
+                log.info("[Sheets] reconcile: %s", counts)
             except Exception as e:
-                log.warning("[Sheets] attempt %s failed: %s", attempt, e)
-                if attempt == 3:
-                    return
-                time.sleep(1.5 * attempt)
+                log.warning("[Sheets] scheduled reconcile failed: %s", e)
 
-    def schedule_sheet_upsert(self, license_info: dict):
-        Thread(target=self.upsert_license_to_sheet, args=(license_info,), daemon=True).start()
+    @commands.command(name="licensereconcile")
+    @commands.has_permissions(administrator=True)
+    async def license_reconcile_cmd(self, ctx: commands.Context):
+        """Diff the licenses table against the Licenses sheet and push only the rows that differ."""
+        async with ctx.typing():
+            try:
+                counts = await self.sheet_writer.reconcile()
+            except Exception as e:
+                log.exception("[Sheets] reconcile failed")
+                await ctx.send(f"❌ Reconcile failed: {e}")
+                return
+        log.info("[Sheets] reconcile by %s: %s", ctx.author, counts)
+
+        embed = discord.Embed(title="License Sheet Reconcile", color=discord.Color.blue())
+        embed.add_field(name="Checked", value=str(counts["checked"]))
+        embed.add_field(name="Added", value=str(counts["added"]))
+        embed.add_field(name="Changed", value=str(counts["changed"]))
+        embed.add_field(name="Unchanged", value=str(counts["unchanged"]))
+        embed.add_field(name="Orphaned", value=str(counts["orphaned"]))
+        embed.add_field(name="Duplicates", value=str(counts["duplicates"]))
+        embed.set_footer(
+            text=(
+                "Rows are compared as the bot writes them (plain text); rows edited by hand or written "
+                "by older versions count as changed once. Orphaned/duplicate rows are reported only; "
+                "nothing is deleted."
+            )
+        )
+        await ctx.send(embed=embed)
 
     # ============================================================
     # FONT / IMAGE
     # ============================================================
-    def load_font(self, size: int, bold: bool = False):
-        files = [
-            ("arialbd.ttf" if bold else "arial.ttf"),
-            "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
-            if bold
-            else "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
-        ]
-        for f in files:
-            try:
-                return ImageFont.truetype(f, size)
-            except Exception:
-                pass
-        return ImageFont.load_default()
-
     def create_license_image(
         self,
         username,
@@ -211,194 +452,10 @@ class LicenseSystem(commands.Cog):
         lic_num,
         license_type,
     ):
-        W, H = 820, 520
-
-        username_str = str(username or "")
-        roleplay_name_str = str(roleplay_name or username_str)
-        age_str = str(age or "")
-        addr_str = str(address or "")
-        eye_str = str(eye_color or "")
-        height_str = str(height or "")
-        lic_num_str = str(lic_num or "")
-
-        full_mask = Image.new("L", (W, H), 0)
-        ImageDraw.Draw(full_mask).rounded_rectangle((0, 0, W, H), 120, fill=255)
-
-        base = Image.new("RGBA", (W, H), (255, 255, 255, 0))
-        base.putalpha(full_mask)
-        card = base.copy()
-        draw = ImageDraw.Draw(card)
-
-        bg = Image.new("RGBA", (W, H), (0, 0, 0, 0))
-        bgd = ImageDraw.Draw(bg)
-
-        for y in range(H):
-            ratio = y / H
-            if license_type == "provisional":
-                r = int(255 - 50 * ratio)
-                g = int(150 + 40 * ratio)
-                b = int(60 - 40 * ratio)
-            else:
-                r = int(150 + 40 * ratio)
-                g = int(180 + 50 * ratio)
-                b = int(220 + 20 * ratio)
-
-            bgd.line((0, y, W, y), fill=(max(0, min(255, r)), max(0, min(255, g)), max(0, min(255, b))))
-
-        wave = Image.new("RGBA", (W, H), (0, 0, 0, 0))
-        wd = ImageDraw.Draw(wave)
-        mesh_color = (255, 180, 100, 45) if license_type == "provisional" else (255, 255, 255, 40)
-
-        for x in range(0, W, 40):
-            for y in range(0, H, 40):
-                wd.arc((x, y, x + 80, y + 80), 0, 180, fill=mesh_color, width=2)
-
-        wave = wave.filter(ImageFilter.GaussianBlur(1.2))
-        bg.alpha_composite(wave)
-
-        bg.putalpha(full_mask)
-        card = Image.alpha_composite(card, bg)
-        draw = ImageDraw.Draw(card)
-
-        HEADER_H = 95
-        if license_type == "provisional":
-            header_color_start = (225, 140, 20)
-            header_color_end = (255, 200, 80)
-            title_text = "LAKEVIEW PROVISIONAL LICENSE"
-            title_font = self.load_font(35, bold=True)
-        else:
-            header_color_start = (35, 70, 160)
-            header_color_end = (60, 100, 190)
-            title_text = "LAKEVIEW CITY DRIVER LICENSE"
-            title_font = self.load_font(39, bold=True)
-
-        header = Image.new("RGBA", (W, HEADER_H), (0, 0, 0, 0))
-        hd = ImageDraw.Draw(header)
-
-        for i in range(HEADER_H):
-            t = i / HEADER_H
-            r = int(header_color_start[0] + (header_color_end[0] - header_color_start[0]) * t)
-            g = int(header_color_start[1] + (header_color_end[1] - header_color_start[1]) * t)
-            b = int(header_color_start[2] + (header_color_end[2] - header_color_start[2]) * t)
-            hd.line((0, i, W, i), fill=(r, g, b))
-
-        header.putalpha(full_mask.crop((0, 0, W, HEADER_H)))
-        card.alpha_composite(header, (0, 0))
-
-        tw = draw.textlength(title_text, font=title_font)
-        draw.text((W / 2 - tw / 2 + 2, 26 + 2), title_text, fill=(0, 0, 0, 120), font=title_font)
-        draw.text((W / 2 - tw / 2, 26), title_text, fill="white", font=title_font)
-
-        try:
-            av = Image.open(io.BytesIO(avatar_bytes)).convert("RGBA")
-            av = av.resize((200, 200))
-            m = Image.new("L", (200, 200), 0)
-            ImageDraw.Draw(m).rounded_rectangle((0, 0, 200, 200), 42, fill=255)
-            av.putalpha(m)
-
-            shadow = av.filter(ImageFilter.GaussianBlur(4))
-            card.alpha_composite(shadow, (58, 158))
-            card.alpha_composite(av, (50, 150))
-        except Exception:
-            pass
-
-        section = self.load_font(24, bold=True)
-        boldf = self.load_font(22, bold=True)
-        normal = self.load_font(22)
-
-        blue = (160, 70, 20) if license_type == "provisional" else (50, 110, 200)
-        grey = (35, 35, 35)
-
-        def ot(x, y, txt, font, fill):
-            for ox, oy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                draw.text((x + ox, y + oy), txt, font=font, fill=(0, 0, 0, 120))
-            draw.text((x, y), txt, font=font, fill=fill)
-
-        ix, iy = 290, 160
-        ot(ix, iy, "IDENTITY:", section, blue)
-        draw.line((ix, iy + 34, ix + 250, iy + 34), fill=blue, width=3)
-        iy += 55
-
-        def wp(x, y, label, value):
-            lw = draw.textlength(label, font=boldf)
-            draw.text((x, y), label, font=boldf, fill=grey)
-            draw.text((x + lw + 10, y), value, font=normal, fill=grey)
-
-        wp(ix, iy, "Name:", roleplay_name_str)
-        wp(ix, iy + 34, "Age:", age_str)
-        wp(ix, iy + 68, "Address:", addr_str)
-
-        px, py = 550, 160
-        ot(px, py, "PHYSICAL:", section, blue)
-        draw.line((px, py + 34, px + 250, py + 34), fill=blue, width=3)
-        py += 55
-        wp(px, py, "Eye Color:", eye_str)
-        wp(px, py + 34, "Height:", height_str)
-
-        BOX_Y, BOX_H = 360, 140
-        if license_type == "provisional":
-            fill_color = (255, 190, 130, 130)
-            outline_color = (180, 90, 20, 255)
-        else:
-            fill_color = (200, 220, 255, 90)
-            outline_color = (80, 140, 255, 180)
-
-        box = Image.new("RGBA", (W - 80, BOX_H), (0, 0, 0, 0))
-        bd = ImageDraw.Draw(box)
-        bd.rounded_rectangle((0, 0, W - 80, BOX_H), radius=45, fill=fill_color, outline=outline_color, width=3)
-        card.alpha_composite(box, (40, BOX_Y))
-
-        ot(60, BOX_Y + 15, "DMV INFO:", section, blue)
-        draw.line((60, BOX_Y + 47, 300, BOX_Y + 47), fill=blue, width=3)
-
-        y2 = BOX_Y + 65
-        draw.text((60, y2), "License Class:", font=boldf, fill=grey)
-        draw.text((245, y2), "Provisional" if license_type == "provisional" else "Standard", font=normal, fill=grey)
-        draw.text((430, y2), f"License #: {lic_num_str}", font=normal, fill=grey)
-
-        y2 += 38
-        draw.text((60, y2), "Issued:", font=boldf, fill=grey)
-        draw.text((150, y2), issued.strftime("%Y-%m-%d"), font=normal, fill=grey)
-        draw.text((330, y2), "Expires:", font=boldf, fill=grey)
-        draw.text((430, y2), expires.strftime("%Y-%m-%d"), font=normal, fill=grey)
-
-        buf = io.BytesIO()
-        card.save(buf, format="PNG")
-        buf.seek(0)
-        return buf.read()
-
-    # ============================================================
-    # DB HELPERS
-    # ============================================================
-    def _ensure_license_table_and_columns(self, conn: sqlite3.Connection):
-        cur = conn.cursor()
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS licenses (
-                discord_id TEXT PRIMARY KEY,
-                roblox_username TEXT,
-                roblox_display TEXT,
-                roleplay_name TEXT,
-                age TEXT,
-                address TEXT,
-                eye_color TEXT,
-                height TEXT,
-                license_number TEXT,
-                issued_at TEXT,
-                expires_at TEXT
-            )
-            """
+        spec = CardSpec.build(
+            username, roleplay_name, age, address, eye_color, height, issued, expires, lic_num, license_type
         )
-        conn.commit()
-
-        cur.execute("PRAGMA table_info(licenses)")
-        cols = {row[1] for row in cur.fetchall()}
-
-        if "license_type" not in cols:
-            cur.execute("ALTER TABLE licenses ADD COLUMN license_type TEXT")
-        if "license_code" not in cols:
-            cur.execute("ALTER TABLE licenses ADD COLUMN license_code TEXT")
-        conn.commit()
+        return render_card(spec, avatar_bytes, encoding=self.card_encoding).data
 
     # ============================================================
     # SEND TO DISCORD (UPDATED: DM user same embed + image as log channel)
@@ -422,46 +479,26 @@ class LicenseSystem(commands.Cog):
 
         uid = int(discord_id)
 
-        # Resolve log channel
-        channel = self.bot.get_channel(self.LOG_CHANNEL_ID)
-        if channel is None:
-            try:
-                channel = await self.bot.fetch_channel(self.LOG_CHANNEL_ID)
-            except Exception:
-                channel = None
+        # Log channel, guild and roles come from the resolver (no per-license lookups)
+        resolved = await self.resolver.ready()
+        channel = resolved.channel
 
-        # Resolve guild/member for roles
-        guild = None
-        if isinstance(channel, discord.TextChannel) and channel.guild:
-            guild = channel.guild
-        elif self.bot.guilds:
-            guild = self.bot.guilds[0]
-
-        # Roles
+        # Roles: one merged member.edit per member via the guild's role queue
         try:
-            if guild:
-                member = guild.get_member(uid)
-                if not member:
-                    try:
-                        member = await guild.fetch_member(uid)
-                    except Exception:
-                        member = None
-
-                if member:
-                    role_prov_1 = guild.get_role(self.ROLE_PROV_1_ID)
-                    role_prov_2 = guild.get_role(self.ROLE_PROV_2_ID)
-                    role_official = guild.get_role(self.ROLE_OFFICIAL_ID)
-
-                    if normalized_type == "provisional":
-                        if role_prov_1:
-                            await member.add_roles(role_prov_1, reason="Provisional license generated")
-                        if role_prov_2:
-                            await member.add_roles(role_prov_2, reason="Provisional license generated")
-                    else:
-                        if role_prov_2:
-                            await member.remove_roles(role_prov_2, reason="Upgraded to official license")
-                        if role_official:
-                            await member.add_roles(role_official, reason="Official license generated")
+            if resolved.guild:
+                if normalized_type == "provisional":
+                    await self._role_queue(resolved.guild).submit(
+                        uid,
+                        add=(self.ROLE_PROV_1_ID, self.ROLE_PROV_2_ID),
+                        reason="Provisional license generated",
+                    )
+                else:
+                    await self._role_queue(resolved.guild).submit(
+                        uid,
+                        add=(self.ROLE_OFFICIAL_ID,),
+                        remove=(self.ROLE_PROV_2_ID,),
+                        reason="Official license generated",
+                    )
         except Exception as e:
             log.warning("Role management error for %s: %s", uid, e)
 
@@ -511,11 +548,15 @@ class LicenseSystem(commands.Cog):
             log.warning("DM send error for %s: %s", uid, e)
 
         # --- 2) Send to log channel (same embed + image) ---
-        if channel and hasattr(channel, "send"):
+        if channel:
             try:
-                file_ch = discord.File(io.BytesIO(img_data), filename=filename)
-                # keep ping in log channel
-                await channel.send(content=f"<@{uid}>", embed=embed, file=file_ch)
+                if self.LOG_DIGEST:
+                    # one message per card unless the queue is backed up
+                    await self.log_poster.post(uid, embed, img_data, filename)
+                else:
+                    file_ch = discord.File(io.BytesIO(img_data), filename=filename)
+                    # keep ping in log channel
+                    await channel.send(content=f"<@{uid}>", embed=embed, file=file_ch)
             except Exception as e:
                 log.warning("Log channel send error for %s: %s", uid, e)
         else:
@@ -525,151 +566,465 @@ class LicenseSystem(commands.Cog):
             log.info("User %s could not be DMed (privacy/blocked).", uid)
 
     # ============================================================
-    # FLASK ROUTES
+    # LICENSE EXPIRY
     # ============================================================
-    def _register_routes(self):
-        @self.app.get("/")
-        def home():
-            return "OK", 200
+    # only DM for fresh expiries; a backlog of long-expired licenses just loses its roles
+    EXPIRY_DM_MAX_LATE = timedelta(days=1)
+
+    async def _expire_licenses(self, due: list[tuple[str, str, str]]):
+        """Remove license roles and post notices for one batch of (discord_id, license_type, expires_at)."""
+        resolved = await self.resolver.ready()
+        channel = resolved.channel
+        guild = resolved.guild
+        if guild is None:
+            raise RuntimeError("no guild available to remove expired license roles")
+
+        now = datetime.utcnow()
+        lines = []
+        for discord_id, license_type, expires_at in due:
+            try:
+                uid = int(discord_id)
+            except (TypeError, ValueError):
+                # not a Discord user; marked handled with the rest of the batch
+                log.warning("[expiry] skipping license with invalid discord_id %r", discord_id)
+                continue
+            provisional = (license_type or "").lower().strip() == "provisional"
+            label = "Provisional" if provisional else "Official"
+
+            member = await resolved.member(uid)
+
+            if member:
+                role_ids = (self.ROLE_PROV_1_ID, self.ROLE_PROV_2_ID) if provisional else (self.ROLE_OFFICIAL_ID,)
+                try:
+                    await self._role_queue(guild).submit(uid, remove=role_ids, reason=f"{label} license expired")
+                except Exception as e:
+                    log.warning("Expiry role removal error for %s: %s", uid, e)
+
+                try:
+                    late = now - datetime.fromisoformat(expires_at)
+                except (TypeError, ValueError):
+                    late = self.EXPIRY_DM_MAX_LATE
+                if late < self.EXPIRY_DM_MAX_LATE:
+                    embed = discord.Embed(
+                        title=f"LKVC: {label} License Expired",
+                        description=(
+                            f"> Your {label.lower()} license has expired and its roles have been removed. "
+                            "Please apply for a new license with the DMV."
+                        ),
+                        color=0xE74C3C,
+                    )
+                    embed.set_thumbnail(url=self.THUMBNAIL_URL)
+                    embed.set_footer(text="Lakeview City DMV • Official Document")
+                    try:
+                        await member.send(embed=embed)
+                    except discord.Forbidden:
+                        log.info("User %s could not be DMed (privacy/blocked).", uid)
+                    except Exception as e:
+                        log.warning("Expiry DM error for %s: %s", uid, e)
+
+            lines.append(f"<@{uid}> • {label} • expired {expires_at[:16].replace('T', ' ')} UTC")
 
-        @self.app.route("/license", methods=["POST"])
-        def license_endpoint():
+        log.info("[expiry] expired %s licenses", len(due))
+        if channel:
             try:
-                data = request.json
-                if not data:
-                    return jsonify({"status": "error", "message": "Invalid JSON"}), 400
-
-                username = data.get("roblox_username")
-                display = data.get("roblox_display")
-                avatar = data.get("roblox_avatar")
-                roleplay = data.get("roleplay_name")
-                age = data.get("age")
-                addr = data.get("address")
-                eye = data.get("eye_color")
-                height = data.get("height")
-                discord_id = data.get("discord_id")
-
-                incoming_type = (data.get("license_type", "official") or "official").lower().strip()
-                if incoming_type in ("standard", "official", "full"):
-                    license_type = "official"
-                elif incoming_type == "provisional":
-                    license_type = "provisional"
-                else:
-                    license_type = "official"
+                await channel.send(
+                    embed=discord.Embed(
+                        title="LKVC: Licenses Expired",
+                        description="\n".join(lines),
+                        color=0xE74C3C,
+                    )
+                )
+            except Exception as e:
+                log.warning("Log channel expiry notice error: %s", e)
 
-                license_code = data.get("license_code", "C")
-                lic_num = data.get("license_number", username)
+    # ============================================================
+    # LICENSE PIPELINE
+    # ============================================================
+    def _parse_license_payload(self, data: dict) -> dict:
+        """Normalize an incoming /license payload; raises ValueError if it is unusable."""
+        def text(key: str, default: Optional[str] = None) -> Optional[str]:
+            # stored as SQLite TEXT and rendered on the card; nested JSON values are rejected
+            value = data.get(key, default)
+            if value is None:
+                return None
+            if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+                raise ValueError(f"{key} must be a string or number")
+            return str(value)
+
+        username = text("roblox_username")
+        avatar = text("roblox_avatar")
+        discord_id = text("discord_id")
+
+        if not username or not avatar or not discord_id:
+            raise ValueError("Missing username/avatar/discord_id")
+        if not (discord_id.isascii() and discord_id.isdigit()):
+            raise ValueError("discord_id must be a numeric Discord user ID")
+
+        incoming_type = (text("license_type", "official") or "official").lower().strip()
+        if incoming_type in ("standard", "official", "full"):
+            license_type = "official"
+        elif incoming_type == "provisional":
+            license_type = "provisional"
+        else:
+            license_type = "official"
+
+        return {
+            "username": username,
+            "display": text("roblox_display"),
+            "avatar": avatar,
+            "roleplay": text("roleplay_name"),
+            "age": text("age"),
+            "addr": text("address"),
+            "eye": text("eye_color"),
+            "height": text("height"),
+            "discord_id": discord_id,
+            "license_type": license_type,
+            "license_code": text("license_code", "C"),
+            "lic_num": text("license_number", username),
+        }
+
+    def _post_license(self, img: bytes, username: str, discord_id: str, license_type: str) -> asyncio.Task:
+        async def post():
+            with METRICS.time("discord"):
+                await self.send_license_to_discord(
+                    img, f"{username}_license.{self.card_encoding.extension}", discord_id, license_type
+                )
 
-                if not username or not avatar or not discord_id:
-                    return jsonify({"status": "error", "message": "Missing username/avatar/discord_id"}), 400
+        task = asyncio.create_task(post())
+        self._background_tasks.add(task)
 
-                r = requests.get(avatar, timeout=15)
-                r.raise_for_status()
-                avatar_bytes = r.content
+        def _done_cb(t: asyncio.Task):
+            self._background_tasks.discard(t)
+            if t.cancelled():
+                return
+            exc = t.exception()
+            if exc:
+                log.error("[/license] send_license_to_discord failed: %s", exc)
+            else:
+                log.info("[/license] License posted+DMd for %s", discord_id)
+
+        task.add_done_callback(_done_cb)
+        return task
+
+    async def _issue_license(self, lic: dict, post: bool = True) -> Optional[asyncio.Task]:
+        """
+        Download, render, store and sync one license.
+        Returns the task posting it to Discord so callers can choose to await it
+        (None when `post` is False, e.g. bulk migrations that must not DM/ping).
+        """
+        username = lic["username"]
+        discord_id = lic["discord_id"]
+        license_type = lic["license_type"]
+
+        with METRICS.time("avatar"):
+            avatar = await self.avatars.get(lic["avatar"])
+
+        issued = datetime.utcnow()
+        expires = issued + (timedelta(days=3) if license_type == "provisional" else timedelta(days=150))
+
+        # rendering is CPU-bound Pillow work; keep it off the event loop (and off our GIL)
+        spec = CardSpec.build(
+            username, lic["roleplay"], lic["age"], lic["addr"], lic["eye"], lic["height"],
+            issued, expires, lic["lic_num"], license_type,
+        )
+        cache_key = self.render_cache.key(spec, avatar.digest, self.card_encoding)
+        img = await self.render_cache.get(cache_key)
+        if img is None:
+            try:
+                rendered = await self.renderer.render(spec, avatar_rgba=avatar.rgba, encoding=self.card_encoding)
+            except Exception:
+                METRICS.error("render")
+                raise
+            # measured inside the worker, so pool queueing time isn't counted as render time
+            METRICS.observe("render", rendered.render_ms / 1000)
+            METRICS.observe("encode", rendered.encode_ms / 1000)
+            log.info(
+                "[render] %s card for %s: %s bytes %s, draw %.1f ms, encode %.1f ms",
+                license_type, discord_id, rendered.size, self.card_encoding.format,
+                rendered.render_ms, rendered.encode_ms,
+            )
+            img = rendered.data
+            await self.render_cache.put(cache_key, img)
+
+        task = self._post_license(img, username, discord_id, license_type) if post else None
+
+        # Google Sheets row, queued in the outbox in the same transaction as the license
+        license_info = {
+            "discord_id": discord_id,
+            "roblox_username": username,
+            "roblox_display": lic["display"],
+            "roleplay_name": lic["roleplay"],
+            "license_number": lic["lic_num"],
+            "license_type": license_type,
+            "license_code": lic["license_code"],
+            "issued_at": issued.strftime("%Y-%m-%d %H:%M:%S"),
+            "expires_at": expires.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+        # Save to DB
+        with METRICS.time("db"):
+            await self.store.upsert_license(
+                (
+                    discord_id,
+                    username,
+                    lic["display"],
+                    lic["roleplay"],
+                    lic["age"],
+                    lic["addr"],
+                    lic["eye"],
+                    lic["height"],
+                    lic["lic_num"],
+                    issued.isoformat(),
+                    expires.isoformat(),
+                    license_type,
+                    lic["license_code"],
+                ),
+                sheet_info=license_info,
+            )
+        self.license_cache.invalidate(discord_id)
+        self.sheet_writer.notify()
+        self.expiry.schedule(discord_id, expires)
 
-                issued = datetime.utcnow()
-                expires = issued + (timedelta(days=3) if license_type == "provisional" else timedelta(days=150))
+        return task
 
-                img = self.create_license_image(
-                    username, avatar_bytes, display, roleplay, age, addr, eye, height,
-                    issued, expires, lic_num, license_type
-                )
+    # ============================================================
+    # ASYNC JOBS (opt-in: LICENSE_ASYNC_JOBS=1 or /license?async=1)
+    # ============================================================
+    async def _enqueue_license_job(self, lic: dict) -> str:
+        job_id = uuid.uuid4().hex
+        await self.store.insert_job(job_id, lic["discord_id"], json.dumps(lic))
+        self._job_queue.put_nowait(job_id)
+        return job_id
+
+    async def _run_license_job(self, job_id: str):
+        payload = await self.store.get_job_payload(job_id)
+        if payload is None:
+            return
 
-                # ✅ thread-safe schedule to bot loop
-                fut = asyncio.run_coroutine_threadsafe(
-                    self.send_license_to_discord(img, f"{username}_license.png", str(discord_id), license_type),
-                    self.bot.loop,
-                )
+        await self.store.set_job_state(job_id, "rendering")
+        try:
+            post_task = await self._issue_license(json.loads(payload))
+            if post_task is not None:
+                await post_task
+        except Exception as e:
+            log.error("[/license] job %s failed: %s", job_id, e)
+            await self.store.set_job_state(job_id, "failed", str(e))
+            return
+        await self.store.set_job_state(job_id, "posted")
 
-                def _done_cb(f: "asyncio.Future"):
-                    exc = f.exception()
-                    if exc:
-                        log.error("[/license] send_license_to_discord failed: %s", exc)
-                    else:
-                        log.info("[/license] License posted+DMd for %s", discord_id)
-
-                fut.add_done_callback(_done_cb)
-
-                # Save to DB
-                conn = sqlite3.connect(self.DB_PATH)
-                self._ensure_license_table_and_columns(conn)
-                cur = conn.cursor()
-
-                cur.execute(
-                    """
-                    INSERT INTO licenses (
-                        discord_id,
-                        roblox_username,
-                        roblox_display,
-                        roleplay_name,
-                        age,
-                        address,
-                        eye_color,
-                        height,
-                        license_number,
-                        issued_at,
-                        expires_at,
-                        license_type,
-                        license_code
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ON CONFLICT(discord_id) DO UPDATE SET
-                        roblox_username = excluded.roblox_username,
-                        roblox_display  = excluded.roblox_display,
-                        roleplay_name   = excluded.roleplay_name,
-                        age             = excluded.age,
-                        address         = excluded.address,
-                        eye_color       = excluded.eye_color,
-                        height          = excluded.height,
-                        license_number  = excluded.license_number,
-                        issued_at       = excluded.issued_at,
-                        expires_at      = excluded.expires_at,
-                        license_type    = excluded.license_type,
-                        license_code    = excluded.license_code
-                    """,
-                    (
-                        str(discord_id),
-                        username,
-                        display,
-                        roleplay,
-                        age,
-                        addr,
-                        eye,
-                        height,
-                        lic_num,
-                        issued.isoformat(),
-                        expires.isoformat(),
-                        license_type,
-                        license_code,
-                    ),
-                )
+    async def _job_worker(self, n: int):
+        while True:
+            job_id = await self._job_queue.get()
+            try:
+                await self._run_license_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error("[/license] job worker %s error on %s: %s", n, job_id, e)
+            finally:
+                self._job_queue.task_done()
+
+    # ============================================================
+    # HTTP ROUTES
+    # ============================================================
+    def _metric_gauges(self) -> list[tuple]:
+        """Queue depths and cache counters, read at scrape time."""
+        return [
+            ("db_pending_upserts", "gauge", "License upserts waiting for the next group commit.", self.store.pending),
+            ("db_batches_committed_total", "counter", "Group commits of license upserts.", self.store.batches_committed),
+            ("db_rows_committed_total", "counter", "License rows written by group commits.", self.store.rows_committed),
+            ("sheet_outbox_depth", "gauge", "Rows waiting in the Sheets outbox.", self.sheet_writer.depth),
+            ("sheet_outbox_oldest_age_seconds", "gauge", "Age of the oldest Sheets outbox row.",
+             round(self.sheet_writer.oldest_age, 3)),
+            ("sheet_rows_written_total", "counter", "Rows written to the Licenses worksheet.", self.sheet_writer.rows_written),
+            ("sheet_index_resyncs_total", "counter", "Rebuilds of the worksheet row index.", self.sheet_writer.index_resyncs),
+            ("job_queue_depth", "gauge", "Async license jobs waiting for a worker.", self._job_queue.qsize()),
+            ("discord_posts_in_flight", "gauge", "License posts/DMs still running.", len(self._background_tasks)),
+            ("expiry_scheduled", "gauge", "Expirations loaded in the current window.", self.expiry.scheduled),
+            ("expired_total", "counter", "Licenses expired by the scheduler.", self.expiry.expired_total),
+            ("discord_member_fetches_total", "counter", "fetch_member REST calls made by the resolver.",
+             self.resolver.member_fetches),
+            ("discord_resolver_refreshes_total", "counter", "Log channel/guild/role re-resolutions.",
+             self.resolver.refreshes),
+            ("role_edit_queue_depth", "gauge", "Members waiting for a role edit.",
+             sum(q.depth for q in self._role_queues.values())),
+            ("role_edits_total", "counter", "Role changes by outcome (edit = one member.edit call).", {
+                (("outcome", "edit"),): sum(q.edits for q in self._role_queues.values()),
+                (("outcome", "merged"),): sum(q.merged for q in self._role_queues.values()),
+                (("outcome", "noop"),): sum(q.skipped for q in self._role_queues.values()),
+            }),
+            ("log_digest_queue_depth", "gauge", "Cards waiting to be posted to the log channel.", self.log_poster.depth),
+            ("log_messages_total", "counter", "Log-channel messages sent by the digest poster.", {
+                (("kind", "single"),): self.log_poster.messages_sent - self.log_poster.digests_sent,
+                (("kind", "digest"),): self.log_poster.digests_sent,
+            }),
+            ("log_cards_posted_total", "counter", "Cards delivered by the digest poster.", self.log_poster.cards_posted),
+            ("render_pool_workers", "gauge", "Render worker processes (0 = threads).",
+             self.renderer.workers if self.renderer.pooled else 0),
+            ("cache_requests_total", "counter", "Cache lookups by cache and result.", {
+                (("cache", "avatar"), ("result", "hit")): self.avatars.hits,
+                (("cache", "avatar"), ("result", "revalidated")): self.avatars.revalidated,
+                (("cache", "avatar"), ("result", "miss")): self.avatars.misses,
+                (("cache", "render"), ("result", "hit")): self.render_cache.hits,
+                (("cache", "render"), ("result", "miss")): self.render_cache.misses,
+                (("cache", "read"), ("result", "hit")): self.license_cache.hits,
+                (("cache", "read"), ("result", "miss")): self.license_cache.misses,
+            }),
+        ]
 
-                conn.commit()
-                conn.close()
-
-                # Google Sheets upsert
-                license_info = {
-                    "discord_id": str(discord_id),
-                    "roblox_username": username,
-                    "roblox_display": display,
-                    "roleplay_name": roleplay,
-                    "license_number": lic_num,
-                    "license_type": license_type,
-                    "license_code": license_code,
-                    "issued_at": issued.strftime("%Y-%m-%d %H:%M:%S"),
-                    "expires_at": expires.strftime("%Y-%m-%d %H:%M:%S"),
-                }
-                self.schedule_sheet_upsert(license_info)
-
-                return jsonify({"status": "ok"}), 200
+    def _register_routes(self):
+        async def home(request: web.Request):
+            return web.Response(text="OK")
 
+        async def license_endpoint(request: web.Request):
+            try:
+                try:
+                    data = await request.json()
+                except Exception:
+                    data = None
+                if not data or not isinstance(data, dict):
+                    return web.json_response({"status": "error", "message": "Invalid JSON"}, status=400)
+
+                try:
+                    lic = self._parse_license_payload(data)
+                except ValueError as e:
+                    return web.json_response({"status": "error", "message": str(e)}, status=400)
+
+                use_async = self.ASYNC_JOBS_DEFAULT
+                if "async" in request.query:
+                    use_async = request.query["async"].lower() in ("1", "true", "yes")
+
+                if use_async:
+                    job_id = await self._enqueue_license_job(lic)
+                    status_url = f"/license/jobs/{job_id}"
+                    return web.json_response(
+                        {"status": "accepted", "job_id": job_id, "status_url": status_url},
+                        status=202,
+                        headers={"Location": status_url},
+                    )
+
+                await self._issue_license(lic)
+                return web.json_response({"status": "ok"})
+
+            except AvatarTooLarge as e:
+                return web.json_response({"status": "error", "message": str(e)}, status=422)
             except Exception as e:
                 import traceback
                 log.error(traceback.format_exc())
-                return jsonify({"status": "error", "message": str(e)}), 500
+                return web.json_response({"status": "error", "message": str(e)}, status=500)
+
+        async def licenses_bulk(request: web.Request):
+            """
+            POST /licenses/bulk — NDJSON in (one /license payload per line), NDJSON out
+            (one result per record as it finishes, then a summary line).
+            ?post=0 stores and syncs without posting to Discord (migrations).
+            """
+            post = request.query.get("post", "1").lower() not in ("0", "false", "no")
+
+            resp = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+            await resp.prepare(request)
+            write_lock = asyncio.Lock()
+            counts = {"ok": 0, "failed": 0}
+
+            async def emit(result: dict):
+                counts["ok" if result["status"] == "ok" else "failed"] += 1
+                async with write_lock:
+                    await resp.write((json.dumps(result) + "\n").encode("utf-8"))
+
+            sem = asyncio.Semaphore(self.BULK_CONCURRENCY)
+            tasks: set[asyncio.Task] = set()
+
+            async def run_one(line_no: int, lic: dict):
+                try:
+                    await self._issue_license(lic, post=post)
+                    await emit({"line": line_no, "discord_id": lic["discord_id"], "status": "ok"})
+                except Exception as e:
+                    await emit({"line": line_no, "discord_id": lic["discord_id"], "status": "error", "message": str(e)})
+                finally:
+                    sem.release()
+
+            line_no = 0
+            try:
+                async for raw in request.content:
+                    line_no += 1
+                    raw = raw.strip()
+                    if not raw:
+                        continue
+                    try:
+                        data = json.loads(raw)
+                        if not isinstance(data, dict):
+                            raise ValueError("Invalid JSON")
+                        lic = self._parse_license_payload(data)
+                    except ValueError as e:
+                        await emit({"line": line_no, "status": "error", "message": str(e)})
+                        continue
+
+                    # backpressure: stop reading the upload while BULK_CONCURRENCY records are in flight
+                    await sem.acquire()
+                    t = asyncio.create_task(run_one(line_no, lic))
+                    tasks.add(t)
+                    t.add_done_callback(tasks.discard)
+            except ValueError as e:
+                # aiohttp raises ValueError for lines over its read limit; stop reading, report, finish in-flight
+                await emit({"line": line_no + 1, "status": "error", "message": f"Unreadable input: {e}"})
+
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+            await resp.write((json.dumps({"status": "done", "lines": line_no, **counts}) + "\n").encode("utf-8"))
+            await resp.write_eof()
+            return resp
+
+        async def license_get(request: web.Request):
+            record, etag = await self.license_cache.get(request.match_info["discord_id"])
+            if record is None:
+                return web.json_response({"status": "error", "message": "No license on file"}, status=404)
+
+            headers = {"ETag": etag, "Cache-Control": "no-cache"}
+            if_none_match = request.headers.get("If-None-Match")
+            if if_none_match:
+                tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+                if etag in tags or "*" in tags:
+                    return web.Response(status=304, headers=headers)
+            return web.json_response({"status": "ok", "license": record}, headers=headers)
+
+        async def licenses_lookup(request: web.Request):
+            """POST /licenses/lookup {"discord_ids": [...]} -> {"licenses": {id: record}, "missing": [...]}"""
+            try:
+                data = await request.json()
+            except Exception:
+                data = None
+            ids = data.get("discord_ids") if isinstance(data, dict) else None
+            if not isinstance(ids, list) or not ids:
+                return web.json_response({"status": "error", "message": "discord_ids must be a non-empty list"}, status=400)
+            if len(ids) > self.LOOKUP_MAX_IDS:
+                return web.json_response(
+                    {"status": "error", "message": f"At most {self.LOOKUP_MAX_IDS} discord_ids per request"}, status=413
+                )
 
-    def _run_flask(self):
-        port = int(os.getenv("PORT", "8080"))
-        self.app.run(host="0.0.0.0", port=port, debug=False, use_reloader=False)
+            entries = await self.license_cache.get_many([str(i).strip() for i in ids])
+            licenses = {d: {**record, "etag": etag} for d, (record, etag) in entries.items() if record is not None}
+            missing = [d for d, (record, _) in entries.items() if record is None]
+            return web.json_response({"status": "ok", "licenses": licenses, "missing": missing})
+
+        async def metrics(request: web.Request):
+            text = METRICS.render(self._metric_gauges())
+            return web.Response(text=text, content_type="text/plain", charset="utf-8",
+                                headers={"X-Content-Type-Options": "nosniff"})
+
+        async def license_job_status(request: web.Request):
+            job = await self.store.get_job(request.match_info["job_id"])
+            if job is None:
+                return web.json_response({"status": "error", "message": "Unknown job"}, status=404)
+            return web.json_response({"status": "ok", **job})
+
+        self.app.router.add_get("/", home)
+        self.app.router.add_get("/metrics", metrics)
+        self.app.router.add_post("/license", license_endpoint)
+        self.app.router.add_get("/license/jobs/{job_id}", license_job_status)
+        self.app.router.add_get(r"/license/{discord_id:\d+}", license_get)
+        self.app.router.add_post("/licenses/lookup", licenses_lookup)
+        self.app.router.add_post("/licenses/bulk", licenses_bulk)
 
 
 async def setup(bot: commands.Bot):
@@ -0,0 +1,417 @@
+"""
+Avatar downloads and the avatar / rendered-card caches used by cogs/license_webhook.py.
+"""
+from __future__ import annotations
+
+import os
+import json
+import time
+import logging
+import asyncio
+import hashlib
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+import aiohttp
+
+from license_render import RENDER_VERSION, CardEncoding, CardSpec, prepare_avatar
+
+log = logging.getLogger("license-bot")
+
+
+class AvatarTooLarge(ValueError):
+    pass
+
+
+class AvatarDownloader:
+    """
+    Shared keep-alive aiohttp session for avatar fetches: bounded connections per
+    host, a hard body-size cap enforced while streaming, and a total timeout so a
+    slow or oversized avatar host cannot pin workers or memory.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, max_bytes: int, per_host: int, timeout: float):
+        self.max_bytes = max_bytes
+        self.per_host = per_host
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.per_host * 4, limit_per_host=self.per_host),
+                timeout=aiohttp.ClientTimeout(total=self.timeout, sock_read=min(self.timeout, 5)),
+                headers={"User-Agent": "LakeviewLicense/1.0"},
+            )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def fetch(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        """Returns (status, body, etag, last_modified); body is None on 304."""
+        await self.start()
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        async with self._session.get(url, headers=headers) as resp:
+            if resp.status == 304:
+                return 304, None, etag, last_modified
+            resp.raise_for_status()
+
+            if resp.content_length is not None and resp.content_length > self.max_bytes:
+                raise AvatarTooLarge(f"avatar is {resp.content_length} bytes (max {self.max_bytes})")
+
+            buf = bytearray()
+            async for chunk in resp.content.iter_chunked(self.CHUNK_SIZE):
+                buf += chunk
+                if len(buf) > self.max_bytes:
+                    raise AvatarTooLarge(f"avatar exceeds {self.max_bytes} bytes")
+
+            return resp.status, bytes(buf), resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+
+
+@dataclass
+class CachedAvatar:
+    url: str
+    digest: str  # sha256 of the source image bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    rgba: Optional[bytes]  # prepared 200x200 rounded avatar; None if the source would not decode
+    checked_at: float  # monotonic time of the last successful (re)validation
+
+    @property
+    def size(self) -> int:
+        return len(self.rgba or b"") + len(self.url)
+
+
+class AvatarCache:
+    """
+    Prepared avatars keyed by URL: an in-memory LRU over a byte-budgeted disk
+    tier, revalidated with a conditional GET once older than `fresh_seconds`.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        memory_budget: int,
+        disk_budget: int,
+        fresh_seconds: float,
+        downloader: AvatarDownloader,
+    ):
+        self.downloader = downloader
+        self.cache_dir = cache_dir
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.fresh_seconds = fresh_seconds
+        self._mem: OrderedDict[str, CachedAvatar] = OrderedDict()
+        self._mem_bytes = 0
+        self._disk: OrderedDict[str, int] = OrderedDict()  # file path -> size, oldest first
+        self._disk_bytes = 0
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+        os.makedirs(os.path.join(cache_dir, "index"), exist_ok=True)
+        os.makedirs(os.path.join(cache_dir, "objects"), exist_ok=True)
+
+    # ---- paths ----
+    def _index_path(self, url: str) -> str:
+        return os.path.join(self.cache_dir, "index", hashlib.sha256(url.encode()).hexdigest()[:32] + ".json")
+
+    def _object_path(self, digest: str, suffix: str = "") -> str:
+        return os.path.join(self.cache_dir, "objects", digest + suffix)
+
+    # ---- memory tier ----
+    def _remember(self, entry: CachedAvatar):
+        old = self._mem.pop(entry.url, None)
+        if old is not None:
+            self._mem_bytes -= old.size
+        self._mem[entry.url] = entry
+        self._mem_bytes += entry.size
+        while self._mem_bytes > self.memory_budget and len(self._mem) > 1:
+            _, evicted = self._mem.popitem(last=False)
+            self._mem_bytes -= evicted.size
+
+    # ---- disk tier ----
+    def load(self):
+        """Index what is already on disk (sync; run once at cog load)."""
+        found = []
+        for sub in ("index", "objects"):
+            directory = os.path.join(self.cache_dir, sub)
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                if sub == "objects" and not name.endswith(".rgba"):
+                    # source blobs written by earlier versions; never read back
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                    continue
+                if name.endswith(".tmp"):
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                found.append((st.st_mtime, path, st.st_size))
+        for _, path, size in sorted(found):
+            self._disk[path] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    # disk tier: prepared avatars under objects/ (content-addressed) and per-URL
+    # validators under index/, kept under `disk_budget` as an mtime LRU like RenderCache
+    def _track_disk(self, files: list[tuple[str, int]]):
+        # files just read or written become the most recently used
+        for path, size in files:
+            self._disk_bytes -= self._disk.pop(path, 0)
+            self._disk[path] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def _evict_disk(self):
+        # an index entry whose object was evicted just reads as a miss
+        while self._disk_bytes > self.disk_budget and self._disk:
+            path, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    # sync; called via asyncio.to_thread
+    def _load_from_disk(self, url: str) -> tuple[Optional[CachedAvatar], list[tuple[str, int]]]:
+        index_path = self._index_path(url)
+        try:
+            with open(index_path, "rb") as f:
+                raw = f.read()
+            meta = json.loads(raw)
+        except (OSError, ValueError):
+            return None, []
+
+        digest = meta.get("digest")
+        if not digest:
+            return None, []
+        used = [(index_path, len(raw))]
+        rgba = None
+        rgba_path = self._object_path(digest, ".rgba")
+        try:
+            with open(rgba_path, "rb") as f:
+                rgba = f.read()
+            used.append((rgba_path, len(rgba)))
+        except OSError:
+            if not meta.get("undecodable"):
+                return None, []
+        for path, _ in used:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        # validators from disk are always revalidated before use
+        entry = CachedAvatar(url, digest, meta.get("etag"), meta.get("last_modified"), rgba, checked_at=0.0)
+        return entry, used
+
+    def _write_to_disk(self, entry: CachedAvatar) -> list[tuple[str, int]]:
+        written = []
+        if entry.rgba is not None:
+            rgba_path = self._object_path(entry.digest, ".rgba")
+            if os.path.exists(rgba_path):
+                os.utime(rgba_path)
+            else:
+                self._atomic_write(rgba_path, entry.rgba)
+            written.append((rgba_path, len(entry.rgba)))
+        meta = {
+            "url": entry.url,
+            "digest": entry.digest,
+            "etag": entry.etag,
+            "last_modified": entry.last_modified,
+            "undecodable": entry.rgba is None,
+        }
+        data = json.dumps(meta).encode("utf-8")
+        self._atomic_write(self._index_path(entry.url), data)
+        written.append((self._index_path(entry.url), len(data)))
+        return written
+
+    @staticmethod
+    def _atomic_write(path: str, data: bytes):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _prepare(source: bytes) -> Optional[bytes]:
+        try:
+            return prepare_avatar(source).tobytes()
+        except Exception:
+            return None
+
+    # ---- public ----
+    async def get(self, url: str) -> CachedAvatar:
+        entry = self._mem.get(url)
+        if entry is not None:
+            self._mem.move_to_end(url)
+        else:
+            entry, used = await asyncio.to_thread(self._load_from_disk, url)
+            self._track_disk(used)
+
+        if entry is not None and time.monotonic() - entry.checked_at < self.fresh_seconds:
+            self.hits += 1
+            return entry
+
+        try:
+            status, body, etag, last_modified = await self.downloader.fetch(
+                url,
+                entry.etag if entry else None,
+                entry.last_modified if entry else None,
+            )
+        except Exception as e:
+            if entry is None:
+                raise
+            # avatar host down: a stale avatar beats a failed card
+            log.warning("[Avatar] revalidation failed for %s, serving cached copy: %s", url, e)
+            self._remember(entry)
+            return entry
+
+        if status == 304 and entry is not None:
+            self.revalidated += 1
+            entry.checked_at = time.monotonic()
+            self._remember(entry)
+            return entry
+
+        self.misses += 1
+        digest = hashlib.sha256(body).hexdigest()
+        if entry is not None and entry.digest == digest:
+            # same bytes behind a new validator: keep the prepared avatar
+            rgba = entry.rgba
+        else:
+            rgba = await asyncio.to_thread(self._prepare, body)
+
+        entry = CachedAvatar(url, digest, etag, last_modified, rgba, checked_at=time.monotonic())
+        self._remember(entry)
+        try:
+            written = await asyncio.to_thread(self._write_to_disk, entry)
+        except OSError as e:
+            log.warning("[Avatar] could not persist %s: %s", url, e)
+        else:
+            self._track_disk(written)
+        return entry
+
+
+class RenderCache:
+    """
+    Finished card images keyed by a stable hash of every card input, so form
+    retries and re-runs of the same submission skip rendering entirely.
+
+    A bounded in-memory LRU sits in front of an on-disk LRU (file mtime is the
+    recency; the oldest files are evicted once the directory exceeds its budget).
+    """
+
+    def __init__(self, cache_dir: str, memory_budget: int, disk_budget: int):
+        self.cache_dir = cache_dir
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self._mem: OrderedDict[str, bytes] = OrderedDict()
+        self._mem_bytes = 0
+        self._disk: OrderedDict[str, int] = OrderedDict()  # key -> file size, oldest first
+        self._disk_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(spec: CardSpec, avatar_digest: Optional[str], encoding: CardEncoding) -> str:
+        material = json.dumps([RENDER_VERSION, asdict(spec), avatar_digest, asdict(encoding)], sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".card")
+
+    def load(self):
+        """Index what is already on disk (sync; run once at cog load)."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        found = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".card"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            found.append((st.st_mtime, name[:-5], st.st_size))
+        for _, key, size in sorted(found):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def _remember(self, key: str, data: bytes):
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._mem_bytes -= len(old)
+        self._mem[key] = data
+        self._mem_bytes += len(data)
+        while self._mem_bytes > self.memory_budget and self._mem:
+            _, evicted = self._mem.popitem(last=False)
+            self._mem_bytes -= len(evicted)
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.disk_budget and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+            os.utime(self._path(key))
+            return data
+        except OSError:
+            return None
+
+    def _write_disk(self, key: str, data: bytes):
+        tmp = f"{self._path(key)}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self._path(key))
+
+    async def get(self, key: str) -> Optional[bytes]:
+        data = self._mem.get(key)
+        if data is not None:
+            self._mem.move_to_end(key)
+            self.hits += 1
+            return data
+
+        if key in self._disk:
+            data = await asyncio.to_thread(self._read_disk, key)
+            if data is not None:
+                self._disk.move_to_end(key)
+                self._remember(key, data)
+                self.hits += 1
+                return data
+            self._disk_bytes -= self._disk.pop(key, 0)
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, data: bytes):
+        self._remember(key, data)
+        try:
+            await asyncio.to_thread(self._write_disk, key, data)
+        except OSError as e:
+            log.warning("[RenderCache] could not persist %s: %s", key, e)
+            return
+        self._disk_bytes -= self._disk.pop(key, 0)
+        self._disk[key] = len(data)
+        self._disk_bytes += len(data)
+        self._evict_disk()
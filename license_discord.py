@@ -0,0 +1,387 @@
+"""
+Discord-side helpers for cogs/license_webhook.py: cached object lookups, role edits and log posting.
+"""
+from __future__ import annotations
+
+import io
+import time
+import logging
+import asyncio
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+import discord
+from discord.ext import commands
+
+
+log = logging.getLogger("license-bot")
+
+
+class LicenseDiscordResolver:
+    """
+    The log channel, guild and license roles, resolved once (REST fallback only
+    for the channel) and kept until a guild/channel/role event marks them
+    stale, plus a cache of members that had to be fetched over REST.
+
+    Members are looked up in the gateway cache first; only misses go to
+    fetch_member, and the result is kept in an LRU of `member_cache_size` for
+    `member_ttl` seconds ("not in the guild" for `not_found_ttl`).
+    """
+
+    # an unresolvable log channel is retried at most this often (not per license)
+    RETRY_UNRESOLVED = 60.0
+
+    def __init__(
+        self,
+        bot: commands.Bot,
+        log_channel_id: int,
+        role_ids: dict[str, int],
+        member_cache_size: int = 2048,
+        member_ttl: float = 60.0,
+        not_found_ttl: float = 300.0,
+    ):
+        self.bot = bot
+        self.log_channel_id = log_channel_id
+        self.role_ids = role_ids
+        self.member_cache_size = member_cache_size
+        self.member_ttl = member_ttl
+        self.not_found_ttl = not_found_ttl
+
+        self.channel: Optional[discord.abc.Messageable] = None
+        self.guild: Optional[discord.Guild] = None
+        self.roles: dict[str, Optional[discord.Role]] = {name: None for name in role_ids}
+        self._stale = True
+        self._retry_at = 0.0
+        self._lock = asyncio.Lock()
+        # user id -> (member or None for "not in guild", cached_at)
+        self._members: OrderedDict[int, tuple[Optional[discord.Member], float]] = OrderedDict()
+        self.refreshes = 0
+        self.member_fetches = 0
+
+    def invalidate(self):
+        self._stale = True
+
+    def _needs_refresh(self) -> bool:
+        return self._stale or (self.channel is None and time.monotonic() >= self._retry_at)
+
+    async def ready(self) -> "LicenseDiscordResolver":
+        """Refresh if an event invalidated us since the last lookup."""
+        if self._needs_refresh():
+            async with self._lock:
+                if self._needs_refresh():
+                    await self._refresh()
+        return self
+
+    async def _refresh(self):
+        await self.bot.wait_until_ready()
+
+        channel = self.bot.get_channel(self.log_channel_id)
+        if channel is None:
+            try:
+                channel = await self.bot.fetch_channel(self.log_channel_id)
+            except Exception as e:
+                log.warning("Could not resolve LOG_CHANNEL_ID %s: %s", self.log_channel_id, e)
+                channel = None
+
+        guild = None
+        if isinstance(channel, discord.TextChannel) and channel.guild:
+            guild = channel.guild
+        elif self.bot.guilds:
+            guild = self.bot.guilds[0]
+
+        if guild is not self.guild:
+            self._members.clear()
+        self.channel = channel if channel and hasattr(channel, "send") else None
+        self.guild = guild
+        self.roles = {name: guild.get_role(rid) if guild else None for name, rid in self.role_ids.items()}
+        self._stale = False
+        self._retry_at = time.monotonic() + self.RETRY_UNRESOLVED
+        self.refreshes += 1
+
+        missing = [name for name, role in self.roles.items() if role is None]
+        if missing:
+            log.warning("License roles not found in guild %s: %s", guild, ", ".join(missing))
+
+    async def member(self, uid: int) -> Optional[discord.Member]:
+        guild = self.guild
+        if guild is None:
+            return None
+        member = guild.get_member(uid)
+        if member is not None:
+            return member
+
+        cached = self._members.get(uid)
+        if cached is not None:
+            member, cached_at = cached
+            ttl = self.member_ttl if member is not None else self.not_found_ttl
+            if time.monotonic() - cached_at < ttl:
+                self._members.move_to_end(uid)
+                return member
+
+        self.member_fetches += 1
+        try:
+            member = await guild.fetch_member(uid)
+        except discord.NotFound:
+            member = None
+        except Exception as e:
+            log.warning("fetch_member failed for %s: %s", uid, e)
+            return None
+        self._remember(uid, member)
+        return member
+
+    def _remember(self, uid: int, member: Optional[discord.Member]):
+        self._members[uid] = (member, time.monotonic())
+        self._members.move_to_end(uid)
+        while len(self._members) > self.member_cache_size:
+            self._members.popitem(last=False)
+
+    def member_updated(self, member: discord.Member):
+        # fetched members aren't updated by the gateway; swap in the fresh object
+        if member.id in self._members:
+            self._remember(member.id, member)
+
+    def member_left(self, uid: int):
+        self._members.pop(uid, None)
+
+
+@dataclass
+class _RoleEdit:
+    add: set[int] = field(default_factory=set)
+    remove: set[int] = field(default_factory=set)
+    reasons: list[str] = field(default_factory=list)
+    waiters: list[asyncio.Future] = field(default_factory=list)
+
+
+class RoleMutationQueue:
+    """
+    Serialised role changes for one guild: pending changes per member are
+    merged and applied as one `member.edit(roles=...)`, `min_interval` apart.
+    """
+
+    MAX_ATTEMPTS = 3
+
+    def __init__(
+        self,
+        guild: discord.Guild,
+        on_edited: Optional[Callable[[discord.Member], None]] = None,
+        min_interval: float = 0.25,
+    ):
+        self.guild = guild
+        self._on_edited = on_edited
+        self.min_interval = min_interval
+        self._pending: OrderedDict[int, _RoleEdit] = OrderedDict()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.edits = 0
+        self.merged = 0
+        self.skipped = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def submit(self, uid: int, add=(), remove=(), reason: str = "") -> asyncio.Future:
+        """Queue a change; the future resolves to True if an edit was made, False if none was needed."""
+        edit = self._pending.get(uid)
+        if edit is None:
+            edit = self._pending[uid] = _RoleEdit()
+        else:
+            self.merged += 1
+        for rid in add:
+            edit.add.add(rid)
+            edit.remove.discard(rid)
+        for rid in remove:
+            edit.remove.add(rid)
+            edit.add.discard(rid)
+        if reason and reason not in edit.reasons:
+            edit.reasons.append(reason)
+
+        fut = asyncio.get_running_loop().create_future()
+        edit.waiters.append(fut)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        self._wake.set()
+        return fut
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for edit in self._pending.values():
+            for fut in edit.waiters:
+                fut.cancel()
+        self._pending.clear()
+
+    async def _run(self):
+        while True:
+            if not self._pending:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+
+            uid, edit = self._pending.popitem(last=False)
+            try:
+                edited = await self._apply(uid, edit)
+            except Exception as e:
+                for fut in edit.waiters:
+                    if not fut.done():
+                        fut.set_exception(e)
+                edited = True  # a failed call still counts against the rate limit
+            else:
+                for fut in edit.waiters:
+                    if not fut.done():
+                        fut.set_result(edited)
+            if edited:
+                await asyncio.sleep(self.min_interval)
+
+    async def _apply(self, uid: int, edit: _RoleEdit) -> bool:
+        # the edit replaces every role, so start from the gateway cache or a fresh fetch, never a cached copy
+        member = self.guild.get_member(uid)
+        if member is None:
+            try:
+                member = await self.guild.fetch_member(uid)
+            except discord.NotFound:
+                return False
+
+        current = [r for r in member.roles if not r.is_default()]
+        final = [r for r in current if r.id not in edit.remove]
+        have = {r.id for r in final}
+        for rid in edit.add:
+            role = self.guild.get_role(rid)
+            if role is not None and rid not in have:
+                final.append(role)
+                have.add(rid)
+
+        if have == {r.id for r in current}:
+            self.skipped += 1
+            return False
+
+        for attempt in range(1, self.MAX_ATTEMPTS + 1):
+            try:
+                updated = await member.edit(roles=final, reason="; ".join(edit.reasons) or None)
+                break
+            except discord.HTTPException as e:
+                # a 429 discord.py gave up on
+                if e.status != 429 or attempt == self.MAX_ATTEMPTS:
+                    raise
+                retry_after = float(e.response.headers.get("Retry-After", "1"))
+                log.warning("[roles] 429 editing %s; retrying in %.1fs", uid, retry_after)
+                await asyncio.sleep(retry_after)
+
+        self.edits += 1
+        if updated is not None and self._on_edited is not None:
+            self._on_edited(updated)
+        return True
+
+
+class LogDigestPoster:
+    """
+    Log-channel posting that switches to digests under load. Posts are queued
+    and sent by one worker: while fewer than `threshold` are waiting each card
+    goes out as its own message (as before); once the queue backs up, up to
+    `max_per_message` cards (Discord's limit is 10 embeds / 10 files) and at
+    most `max_bytes` of attachments are packed into one message that mentions
+    every recipient.
+    """
+
+    MAX_PER_MESSAGE = 10
+
+    def __init__(
+        self,
+        get_channel: Callable[[], Awaitable[Optional[discord.abc.Messageable]]],
+        threshold: int = 3,
+        max_per_message: int = MAX_PER_MESSAGE,
+        max_bytes: int = 8 * 1024 * 1024,
+    ):
+        self._get_channel = get_channel
+        self.threshold = threshold
+        self.max_per_message = min(max_per_message, self.MAX_PER_MESSAGE)
+        self.max_bytes = max_bytes
+        # (uid, embed, img_data, filename, future)
+        self._queue: deque[tuple[int, discord.Embed, bytes, str, asyncio.Future]] = deque()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.messages_sent = 0
+        self.digests_sent = 0
+        self.cards_posted = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    async def post(self, uid: int, embed: discord.Embed, img_data: bytes, filename: str):
+        """Queue one card and wait until the message carrying it has been sent."""
+        fut = asyncio.get_running_loop().create_future()
+        self._queue.append((uid, embed, img_data, filename, fut))
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        self._wake.set()
+        await fut
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        while self._queue:
+            self._queue.popleft()[-1].cancel()
+
+    def _take(self) -> list:
+        if len(self._queue) < self.threshold:
+            return [self._queue.popleft()]
+        batch = [self._queue.popleft()]
+        size = len(batch[0][2])
+        while self._queue and len(batch) < self.max_per_message and size + len(self._queue[0][2]) <= self.max_bytes:
+            item = self._queue.popleft()
+            batch.append(item)
+            size += len(item[2])
+        return batch
+
+    async def _run(self):
+        while True:
+            if not self._queue:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+
+            batch = self._take()
+            try:
+                await self._send(batch)
+            except Exception as e:
+                for *_, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+            else:
+                for *_, fut in batch:
+                    if not fut.done():
+                        fut.set_result(None)
+
+    async def _send(self, batch: list):
+        channel = await self._get_channel()
+        if channel is None:
+            raise RuntimeError("log channel is not available")
+
+        if len(batch) == 1:
+            uid, embed, img_data, filename, _ = batch[0]
+            await channel.send(
+                content=f"<@{uid}>", embed=embed, file=discord.File(io.BytesIO(img_data), filename=filename)
+            )
+        else:
+            embeds, files, used = [], [], set()
+            for i, (uid, embed, img_data, filename, _) in enumerate(batch):
+                # attachment names must be unique within one message
+                if filename in used:
+                    filename = f"{i}_{filename}"
+                    embed = embed.copy()
+                    embed.set_image(url=f"attachment://{filename}")
+                used.add(filename)
+                embeds.append(embed)
+                files.append(discord.File(io.BytesIO(img_data), filename=filename))
+            mentions = " ".join(dict.fromkeys(f"<@{uid}>" for uid, *_ in batch))
+            await channel.send(content=mentions, embeds=embeds, files=files)
+            self.digests_sent += 1
+
+        self.messages_sent += 1
+        self.cards_posted += len(batch)
@@ -0,0 +1,134 @@
+"""
+Expiry scheduling for licenses in workforce.db, used by cogs/license_webhook.py.
+"""
+from __future__ import annotations
+
+import logging
+import asyncio
+import heapq
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from license_metrics import METRICS
+from license_store import LicenseStore
+
+log = logging.getLogger("license-bot")
+
+
+class LicenseExpiryScheduler:
+    """
+    Hands licenses to `on_expired` as their `expires_at` passes, from a min-heap
+    of the next `window` of expirations instead of rescanning the table.
+    """
+
+    RETRY_DELAY = timedelta(minutes=1)
+
+    def __init__(
+        self,
+        store: LicenseStore,
+        on_expired: Callable[[list[tuple[str, str, str]]], Awaitable[None]],
+        window: float = 6 * 3600,
+        max_loaded: int = 5000,
+        batch_size: int = 10,
+        batch_interval: float = 5.0,
+    ):
+        self.store = store
+        self._on_expired = on_expired
+        self.window = timedelta(seconds=window)
+        self.max_loaded = max_loaded
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self._heap: list[tuple[datetime, str]] = []
+        self._loaded_until: Optional[datetime] = None
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.expired_total = 0
+
+    @property
+    def scheduled(self) -> int:
+        return len(self._heap)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def schedule(self, discord_id: str, expires_at: datetime):
+        """A license was (re-)issued; later expirations are picked up by the window load that covers them."""
+        if self._loaded_until is not None and expires_at <= self._loaded_until:
+            heapq.heappush(self._heap, (expires_at, discord_id))
+            self._wake.set()
+
+    async def _load_window(self):
+        # at most `max_loaded` rows from the partial expires_at index
+        until = datetime.utcnow() + self.window
+        rows = await self.store.expiring_before(until.isoformat(), self.max_loaded)
+        heap = []
+        for discord_id, expires_at in rows:
+            try:
+                heap.append((datetime.fromisoformat(expires_at), discord_id))
+            except (TypeError, ValueError):
+                log.warning("[expiry] unparseable expires_at %r for %s", expires_at, discord_id)
+        heapq.heapify(heap)
+        self._heap = heap
+        # a truncated load only covers up to its last row; the rest comes with the next load
+        self._loaded_until = max(heap)[0] if len(rows) == self.max_loaded and heap else until
+        log.info("[expiry] %s licenses expire before %s", len(heap), self._loaded_until.isoformat(timespec="seconds"))
+
+    async def _run(self):
+        while True:
+            try:
+                await self._step()
+            except Exception:
+                log.exception("[expiry] scheduler pass failed; reloading in %s", self.RETRY_DELAY)
+                # anything popped but not marked handled is still unhandled in the table
+                self._heap = []
+                self._loaded_until = None
+                await asyncio.sleep(self.RETRY_DELAY.total_seconds())
+
+    async def _step(self):
+        if self._loaded_until is None:
+            await self._load_window()
+            return
+
+        now = datetime.utcnow()
+        if self._heap and self._heap[0][0] <= now:
+            await self._expire_due(now)
+            # so a backlog (e.g. after downtime) doesn't burst the Discord rate limits
+            await asyncio.sleep(self.batch_interval)
+            return
+        if not self._heap and now >= self._loaded_until:
+            await self._load_window()
+            return
+
+        wake_at = self._heap[0][0] if self._heap else self._loaded_until
+        self._wake.clear()
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout=(wake_at - now).total_seconds())
+        except asyncio.TimeoutError:
+            pass
+
+    async def _expire_due(self, now: datetime):
+        batch: dict[str, None] = {}
+        while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size:
+            batch[heapq.heappop(self._heap)[1]] = None
+
+        # re-check against the table: a license re-issued since it was loaded is left alone
+        due = await self.store.confirm_expired(list(batch), now.isoformat())
+        if not due:
+            return
+        try:
+            with METRICS.time("expiry"):
+                await self._on_expired(due)
+        except Exception as e:
+            log.warning("[expiry] batch of %s failed, retrying in %s: %s", len(due), self.RETRY_DELAY, e)
+            for discord_id, _, _ in due:
+                heapq.heappush(self._heap, (now + self.RETRY_DELAY, discord_id))
+            return
+        await self.store.mark_expiry_handled([(discord_id, expires_at) for discord_id, _, expires_at in due])
+        self.expired_total += len(due)
@@ -0,0 +1,159 @@
+"""
+Stage timers and counters for the license pipeline, served by
+cogs/license_webhook.py at GET /metrics in the Prometheus text format.
+
+Latencies go into fixed-bucket histograms (cheap to update, mergeable by
+Prometheus); p50/p95/p99 are also estimated from the buckets and exported as
+gauges so they can be read straight off /metrics without a query.
+"""
+from __future__ import annotations
+
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Iterable, Optional, Union
+
+# seconds; covers a sub-ms cache hit up to a minute-long Sheets/Discord stall
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class LatencyHistogram:
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        i = 0
+        while i < len(self.buckets) and seconds > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Linear interpolation inside the bucket holding the q-th sample (as histogram_quantile does)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+Number = Union[int, float]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class PipelineMetrics:
+    """
+    Process-wide registry: `time(stage)` / `observe(stage, seconds)` for
+    latencies, `error(stage)` for failures, `request(route, method, status)` for the
+    HTTP API. Gauges (queue depths, cache counters) are passed to `render()` by
+    the owner at scrape time rather than stored here.
+    """
+
+    def __init__(self, prefix: str = "license"):
+        self.prefix = prefix
+        self.stages: dict[str, LatencyHistogram] = {}
+        self.stage_errors: Counter[str] = Counter()
+        self.requests: Counter[tuple[str, str, int]] = Counter()
+
+    def observe(self, stage: str, seconds: float):
+        hist = self.stages.get(stage)
+        if hist is None:
+            hist = self.stages[stage] = LatencyHistogram()
+        hist.observe(seconds)
+
+    def error(self, stage: str):
+        self.stage_errors[stage] += 1
+
+    @contextmanager
+    def time(self, stage: str):
+        """Time a block (sync or containing awaits); an exception counts as a stage error."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.error(stage)
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - t0)
+
+    def request(self, route: str, method: str, status: int):
+        self.requests[(route, method, status)] += 1
+
+    def render(self, extra: Iterable[tuple[str, str, str, Union[Number, dict[tuple, Number]]]] = ()) -> str:
+        """
+        Prometheus text exposition. `extra` is (name, type, help, value) where
+        value is a number or {((label, value), ...): number}.
+        """
+        p = self.prefix
+        out: list[str] = []
+
+        name = f"{p}_stage_duration_seconds"
+        out.append(f"# HELP {name} Time spent in each license pipeline stage.")
+        out.append(f"# TYPE {name} histogram")
+        for stage, hist in sorted(self.stages.items()):
+            cumulative = 0
+            for bound, n in zip(hist.buckets, hist.counts):
+                cumulative += n
+                out.append(f"{name}_bucket{_labels({'stage': stage, 'le': repr(bound)})} {cumulative}")
+            out.append(f"{name}_bucket{_labels({'stage': stage, 'le': '+Inf'})} {hist.count}")
+            out.append(f"{name}_sum{_labels({'stage': stage})} {hist.sum:.6f}")
+            out.append(f"{name}_count{_labels({'stage': stage})} {hist.count}")
+
+        name = f"{p}_stage_duration_quantile_seconds"
+        out.append(f"# HELP {name} p50/p95/p99 per stage, estimated from the histogram buckets.")
+        out.append(f"# TYPE {name} gauge")
+        for stage, hist in sorted(self.stages.items()):
+            for q in QUANTILES:
+                value = hist.quantile(q)
+                if value is not None:
+                    out.append(f"{name}{_labels({'stage': stage, 'quantile': str(q)})} {value:.6f}")
+
+        name = f"{p}_stage_errors_total"
+        out.append(f"# HELP {name} Failures per license pipeline stage.")
+        out.append(f"# TYPE {name} counter")
+        for stage in sorted(set(self.stages) | set(self.stage_errors)):
+            out.append(f"{name}{_labels({'stage': stage})} {self.stage_errors[stage]}")
+
+        name = f"{p}_http_requests_total"
+        out.append(f"# HELP {name} License API requests by route, method and status.")
+        out.append(f"# TYPE {name} counter")
+        for (route, method, status), n in sorted(self.requests.items()):
+            out.append(f"{name}{_labels({'route': route, 'method': method, 'status': str(status)})} {n}")
+
+        for metric, kind, help_text, value in extra:
+            name = f"{p}_{metric}"
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            if isinstance(value, dict):
+                for label_items, v in value.items():
+                    out.append(f"{name}{_labels(dict(label_items))} {v}")
+            else:
+                out.append(f"{name} {value}")
+
+        return "\n".join(out) + "\n"
+
+
+METRICS = PipelineMetrics()
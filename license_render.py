@@ -0,0 +1,543 @@
+"""
+License card renderer used by cogs/license_webhook.py.
+
+Gradients are computed as NumPy arrays in a single pass and wrapped as Pillow
+images with Image.frombuffer (no copy), so larger / high-DPI card sizes cost
+about the same as the default 820x520 card. Rendering itself is plain
+module-level functions over picklable CardSpec / CardEncoding values so it
+can run in a process pool (CardRenderer).
+"""
+from __future__ import annotations
+
+import io
+import os
+import time
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+log = logging.getLogger("license-bot")
+
+RGB = Tuple[int, int, int]
+
+
+def _wrap_rgba(arr: np.ndarray) -> Image.Image:
+    h, w, _ = arr.shape
+    # the image keeps a reference to `arr`; Pillow treats it as read-only and
+    # copies on first in-place edit, so compose with Image.alpha_composite instead
+    return Image.frombuffer("RGBA", (w, h), arr, "raw", "RGBA", 0, 1)
+
+
+def rounded_mask(size: Tuple[int, int], radius: int) -> Image.Image:
+    """L-mode mask of a filled rounded rectangle covering the whole `size`."""
+    w, h = size
+    mask = Image.new("L", (w, h), 0)
+    ImageDraw.Draw(mask).rounded_rectangle((0, 0, w, h), radius, fill=255)
+    return mask
+
+
+def vertical_gradient(
+    size: Tuple[int, int],
+    start: RGB,
+    end: RGB,
+    alpha: Optional[Image.Image] = None,
+) -> Image.Image:
+    """
+    Top-to-bottom linear RGBA gradient from `start` to `end`.
+
+    Row y gets int(start + (end - start) * y / h) per channel, which matches the
+    old per-row ImageDraw.line loop pixel for pixel. `alpha` (an L image of the
+    same size) is written straight into the alpha channel; default is opaque.
+    """
+    w, h = size
+    t = np.arange(h, dtype=np.float64) / h
+    s = np.asarray(start, dtype=np.float64)
+    e = np.asarray(end, dtype=np.float64)
+
+    rows = s[None, :] + (e - s)[None, :] * t[:, None]
+    rows = np.clip(np.trunc(rows), 0, 255).astype("<u4")
+
+    # pack each row colour into one little-endian RGBA word so the fill is a
+    # single contiguous broadcast instead of four strided channel writes
+    packed = rows[:, 0] | (rows[:, 1] << 8) | (rows[:, 2] << 16)
+    if alpha is None:
+        words = np.empty((h, w), dtype="<u4")
+        words[:] = (packed | np.uint32(0xFF000000))[:, None]
+    else:
+        a = np.asarray(alpha.convert("L"), dtype="<u4")
+        words = packed[:, None] | (a << 24)
+    return _wrap_rgba(words.view(np.uint8).reshape(h, w, 4))
+
+
+# ============================================================
+# FONTS
+# ============================================================
+class FontRegistry:
+    """
+    Resolves each font family/weight to a file once and shares the parsed
+    FreeType faces, keyed by (family, size, bold).
+    """
+
+    # tried in order; the first one FreeType can open wins for the process lifetime
+    CANDIDATES: Dict[Tuple[str, bool], Tuple[str, ...]] = {
+        ("sans", False): ("arial.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"),
+        ("sans", True): ("arialbd.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"),
+    }
+
+    def __init__(self):
+        self._paths: Dict[Tuple[str, bool], Optional[str]] = {}
+        self._faces: Dict[Tuple[str, int, bool], ImageFont.ImageFont | ImageFont.FreeTypeFont] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, family: str = "sans", bold: bool = False) -> Optional[str]:
+        key = (family, bold)
+        if key not in self._paths:
+            path = None
+            for candidate in self.CANDIDATES.get(key, ()):
+                try:
+                    ImageFont.truetype(candidate, 12)
+                except OSError:
+                    continue
+                path = candidate
+                break
+            self._paths[key] = path
+        return self._paths[key]
+
+    def get(self, size: int, bold: bool = False, family: str = "sans"):
+        key = (family, size, bold)
+        face = self._faces.get(key)
+        if face is not None:
+            return face
+
+        with self._lock:
+            face = self._faces.get(key)
+            if face is None:
+                path = self.resolve(family, bold)
+                face = ImageFont.truetype(path, size) if path else ImageFont.load_default()
+                self._faces[key] = face
+        return face
+
+    def preload(self, specs: Iterable[Tuple[int, bool]], family: str = "sans"):
+        for size, bold in specs:
+            self.get(size, bold=bold, family=family)
+
+    def resolved_paths(self) -> Dict[str, Optional[str]]:
+        return {
+            f"{family}{'-bold' if bold else ''}": path
+            for (family, bold), path in sorted(self._paths.items())
+        }
+
+
+# (size, bold) pairs the license card uses
+CARD_FONT_SPECS = ((39, True), (35, True), (24, True), (22, True), (22, False))
+
+FONTS = FontRegistry()
+
+
+# ============================================================
+# CARD
+# ============================================================
+LICENSE_TYPES = ("provisional", "official")
+
+# bump whenever the card layout changes so cached renders are not reused
+RENDER_VERSION = 1
+
+AVATAR_SIZE = 200
+
+
+@dataclass(frozen=True)
+class CardSpec:
+    """Everything applicant-specific that ends up on a card (picklable, hashable)."""
+
+    license_type: str
+    username: str
+    roleplay_name: str
+    age: str
+    address: str
+    eye_color: str
+    height: str
+    license_number: str
+    issued: str  # YYYY-MM-DD
+    expires: str  # YYYY-MM-DD
+
+    @classmethod
+    def build(
+        cls,
+        username,
+        roleplay_name,
+        age,
+        address,
+        eye_color,
+        height,
+        issued: datetime,
+        expires: datetime,
+        lic_num,
+        license_type: str,
+    ) -> "CardSpec":
+        username_str = str(username or "")
+        return cls(
+            license_type=license_type,
+            username=username_str,
+            roleplay_name=str(roleplay_name or username_str),
+            age=str(age or ""),
+            address=str(address or ""),
+            eye_color=str(eye_color or ""),
+            height=str(height or ""),
+            license_number=str(lic_num or ""),
+            issued=issued.strftime("%Y-%m-%d"),
+            expires=expires.strftime("%Y-%m-%d"),
+        )
+
+
+def build_card_template(license_type: str) -> Image.Image:
+    """
+    Everything on the card that does not depend on the applicant, pre-composited:
+    rounded mask, background gradient, blurred arc mesh, header + title,
+    DMV info box and the static labels/rules.
+    """
+    W, H = 820, 520
+
+    full_mask = rounded_mask((W, H), 120)
+
+    base = Image.new("RGBA", (W, H), (255, 255, 255, 0))
+    base.putalpha(full_mask)
+    card = base.copy()
+
+    if license_type == "provisional":
+        bg = vertical_gradient((W, H), (255, 150, 60), (205, 190, 20))
+    else:
+        bg = vertical_gradient((W, H), (150, 180, 220), (190, 230, 240))
+
+    wave = Image.new("RGBA", (W, H), (0, 0, 0, 0))
+    wd = ImageDraw.Draw(wave)
+    mesh_color = (255, 180, 100, 45) if license_type == "provisional" else (255, 255, 255, 40)
+
+    for x in range(0, W, 40):
+        for y in range(0, H, 40):
+            wd.arc((x, y, x + 80, y + 80), 0, 180, fill=mesh_color, width=2)
+
+    wave = wave.filter(ImageFilter.GaussianBlur(1.2))
+    bg = Image.alpha_composite(bg, wave)
+
+    bg.putalpha(full_mask)
+    card = Image.alpha_composite(card, bg)
+    draw = ImageDraw.Draw(card)
+
+    HEADER_H = 95
+    if license_type == "provisional":
+        header_color_start = (225, 140, 20)
+        header_color_end = (255, 200, 80)
+        title_text = "LAKEVIEW PROVISIONAL LICENSE"
+        title_font = FONTS.get(35, bold=True)
+    else:
+        header_color_start = (35, 70, 160)
+        header_color_end = (60, 100, 190)
+        title_text = "LAKEVIEW CITY DRIVER LICENSE"
+        title_font = FONTS.get(39, bold=True)
+
+    header = vertical_gradient(
+        (W, HEADER_H), header_color_start, header_color_end, alpha=full_mask.crop((0, 0, W, HEADER_H))
+    )
+    card.alpha_composite(header, (0, 0))
+
+    tw = draw.textlength(title_text, font=title_font)
+    draw.text((W / 2 - tw / 2 + 2, 26 + 2), title_text, fill=(0, 0, 0, 120), font=title_font)
+    draw.text((W / 2 - tw / 2, 26), title_text, fill="white", font=title_font)
+
+    section = FONTS.get(24, bold=True)
+    boldf = FONTS.get(22, bold=True)
+    normal = FONTS.get(22)
+
+    blue = (160, 70, 20) if license_type == "provisional" else (50, 110, 200)
+    grey = (35, 35, 35)
+
+    def ot(x, y, txt, font, fill):
+        for ox, oy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+            draw.text((x + ox, y + oy), txt, font=font, fill=(0, 0, 0, 120))
+        draw.text((x, y), txt, font=font, fill=fill)
+
+    ix, iy = 290, 160
+    ot(ix, iy, "IDENTITY:", section, blue)
+    draw.line((ix, iy + 34, ix + 250, iy + 34), fill=blue, width=3)
+    iy += 55
+    draw.text((ix, iy), "Name:", font=boldf, fill=grey)
+    draw.text((ix, iy + 34), "Age:", font=boldf, fill=grey)
+    draw.text((ix, iy + 68), "Address:", font=boldf, fill=grey)
+
+    px, py = 550, 160
+    ot(px, py, "PHYSICAL:", section, blue)
+    draw.line((px, py + 34, px + 250, py + 34), fill=blue, width=3)
+    py += 55
+    draw.text((px, py), "Eye Color:", font=boldf, fill=grey)
+    draw.text((px, py + 34), "Height:", font=boldf, fill=grey)
+
+    BOX_Y, BOX_H = 360, 140
+    if license_type == "provisional":
+        fill_color = (255, 190, 130, 130)
+        outline_color = (180, 90, 20, 255)
+    else:
+        fill_color = (200, 220, 255, 90)
+        outline_color = (80, 140, 255, 180)
+
+    box = Image.new("RGBA", (W - 80, BOX_H), (0, 0, 0, 0))
+    bd = ImageDraw.Draw(box)
+    bd.rounded_rectangle((0, 0, W - 80, BOX_H), radius=45, fill=fill_color, outline=outline_color, width=3)
+    card.alpha_composite(box, (40, BOX_Y))
+
+    ot(60, BOX_Y + 15, "DMV INFO:", section, blue)
+    draw.line((60, BOX_Y + 47, 300, BOX_Y + 47), fill=blue, width=3)
+
+    y2 = BOX_Y + 65
+    draw.text((60, y2), "License Class:", font=boldf, fill=grey)
+    draw.text((245, y2), "Provisional" if license_type == "provisional" else "Standard", font=normal, fill=grey)
+
+    y2 += 38
+    draw.text((60, y2), "Issued:", font=boldf, fill=grey)
+    draw.text((330, y2), "Expires:", font=boldf, fill=grey)
+
+    return card
+
+
+
+_TEMPLATES: Dict[str, Image.Image] = {}
+_TEMPLATES_LOCK = threading.Lock()
+
+
+def get_card_template(license_type: str) -> Image.Image:
+    template = _TEMPLATES.get(license_type)
+    if template is None:
+        with _TEMPLATES_LOCK:
+            template = _TEMPLATES.get(license_type)
+            if template is None:
+                template = build_card_template(license_type)
+                _TEMPLATES[license_type] = template
+    return template
+
+
+def warm_renderer():
+    """Preload fonts and template layers (cog load / process-pool worker init)."""
+    FONTS.preload(CARD_FONT_SPECS)
+    for license_type in LICENSE_TYPES:
+        get_card_template(license_type)
+
+
+def prepare_avatar(avatar_bytes: bytes) -> Image.Image:
+    """Decode an avatar and cut it to the card's 200x200 rounded square."""
+    av = Image.open(io.BytesIO(avatar_bytes))
+    # cheap downscale while decoding: JPEG decodes at 1/2..1/8 scale via draft,
+    # and resize() box-reduces by an integer factor first when the source is
+    # at least 3x the target (normal 420px headshots are untouched)
+    av.draft("RGB", (AVATAR_SIZE, AVATAR_SIZE))
+    if av.mode not in ("RGB", "RGBA"):
+        av = av.convert("RGBA")
+    av = av.resize((AVATAR_SIZE, AVATAR_SIZE), reducing_gap=3.0).convert("RGBA")
+    m = Image.new("L", (AVATAR_SIZE, AVATAR_SIZE), 0)
+    ImageDraw.Draw(m).rounded_rectangle((0, 0, AVATAR_SIZE, AVATAR_SIZE), 42, fill=255)
+    av.putalpha(m)
+    return av
+
+
+def avatar_from_rgba(avatar_rgba: bytes) -> Image.Image:
+    return Image.frombytes("RGBA", (AVATAR_SIZE, AVATAR_SIZE), avatar_rgba)
+
+
+def draw_card(
+    spec: CardSpec,
+    avatar_bytes: Optional[bytes] = None,
+    avatar_rgba: Optional[bytes] = None,
+) -> Image.Image:
+    """
+    Compose one card. Static layers come from the template cache.
+    Pass either the encoded avatar (`avatar_bytes`) or an already prepared one
+    (`avatar_rgba`, raw 200x200 RGBA from prepare_avatar(...).tobytes()).
+    """
+    card = get_card_template(spec.license_type).copy()
+    draw = ImageDraw.Draw(card)
+
+    try:
+        av = avatar_from_rgba(avatar_rgba) if avatar_rgba is not None else prepare_avatar(avatar_bytes)
+        shadow = av.filter(ImageFilter.GaussianBlur(4))
+        card.alpha_composite(shadow, (58, 158))
+        card.alpha_composite(av, (50, 150))
+    except Exception:
+        pass
+
+    boldf = FONTS.get(22, bold=True)
+    normal = FONTS.get(22)
+    grey = (35, 35, 35)
+
+    def wp(x, y, label, value):
+        lw = draw.textlength(label, font=boldf)
+        draw.text((x + lw + 10, y), value, font=normal, fill=grey)
+
+    ix, iy = 290, 215
+    wp(ix, iy, "Name:", spec.roleplay_name)
+    wp(ix, iy + 34, "Age:", spec.age)
+    wp(ix, iy + 68, "Address:", spec.address)
+
+    px, py = 550, 215
+    wp(px, py, "Eye Color:", spec.eye_color)
+    wp(px, py + 34, "Height:", spec.height)
+
+    y2 = 360 + 65
+    draw.text((430, y2), f"License #: {spec.license_number}", font=normal, fill=grey)
+
+    y2 += 38
+    draw.text((150, y2), spec.issued, font=normal, fill=grey)
+    draw.text((430, y2), spec.expires, font=normal, fill=grey)
+
+    return card
+
+
+# ============================================================
+# ENCODING
+# ============================================================
+CARD_FORMATS = ("png", "png-palette", "webp")
+
+
+@dataclass(frozen=True)
+class CardEncoding:
+    """
+    How finished cards are encoded for upload.
+
+    png          zlib PNG at `compress_level` (0-9; Pillow's default is 6)
+    png-palette  quantized to `colors` (<= 256) then PNG; much smaller, slightly lossy
+    webp         lossless WebP at effort `method` (0-6)
+    """
+
+    format: str = "png"
+    compress_level: int = 6
+    colors: int = 256
+    method: int = 4
+
+    @classmethod
+    def from_env(cls) -> "CardEncoding":
+        fmt = os.getenv("LICENSE_CARD_FORMAT", "png").lower().strip()
+        if fmt not in CARD_FORMATS:
+            log.warning("Unknown LICENSE_CARD_FORMAT %r; using png", fmt)
+            fmt = "png"
+        return cls(
+            format=fmt,
+            compress_level=max(0, min(9, int(os.getenv("LICENSE_PNG_COMPRESS_LEVEL", "6")))),
+            colors=max(2, min(256, int(os.getenv("LICENSE_CARD_COLORS", "256")))),
+            method=max(0, min(6, int(os.getenv("LICENSE_WEBP_METHOD", "4")))),
+        )
+
+    @property
+    def extension(self) -> str:
+        return "webp" if self.format == "webp" else "png"
+
+
+def encode_card(card: Image.Image, encoding: CardEncoding) -> bytes:
+    buf = io.BytesIO()
+    if encoding.format == "webp":
+        card.save(buf, format="WEBP", lossless=True, method=encoding.method)
+    elif encoding.format == "png-palette":
+        pal = card.quantize(colors=encoding.colors, method=Image.Quantize.FASTOCTREE)
+        pal.save(buf, format="PNG", compress_level=encoding.compress_level)
+    else:
+        card.save(buf, format="PNG", compress_level=encoding.compress_level)
+    return buf.getvalue()
+
+
+@dataclass(frozen=True)
+class RenderedCard:
+    data: bytes
+    extension: str
+    render_ms: float
+    encode_ms: float
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+
+def render_card(
+    spec: CardSpec,
+    avatar_bytes: Optional[bytes] = None,
+    avatar_rgba: Optional[bytes] = None,
+    encoding: CardEncoding = CardEncoding(),
+) -> RenderedCard:
+    t0 = time.perf_counter()
+    card = draw_card(spec, avatar_bytes, avatar_rgba)
+    t1 = time.perf_counter()
+    data = encode_card(card, encoding)
+    t2 = time.perf_counter()
+    return RenderedCard(data, encoding.extension, (t1 - t0) * 1000, (t2 - t1) * 1000)
+
+
+# ============================================================
+# PROCESS POOL
+# ============================================================
+def default_render_workers() -> int:
+    return min(4, max(1, (os.cpu_count() or 2) - 1))
+
+
+class CardRenderer:
+    """
+    Renders cards in a ProcessPoolExecutor so Pillow work does not hold the
+    bot's GIL. Falls back to a thread when the pool is disabled (workers=0),
+    cannot be created on this platform, or breaks at runtime.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def pooled(self) -> bool:
+        return self._pool is not None
+
+    def start(self):
+        if self.workers <= 0 or self._pool is not None:
+            return
+        # bot.py starts the bot at import time, so spawn/forkserver children would
+        # re-run it; only fork is safe here. Elsewhere we render on threads.
+        if "fork" not in multiprocessing.get_all_start_methods():
+            log.warning("Render pool unavailable (no fork start method); rendering on threads")
+            return
+        try:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("fork"),
+                initializer=warm_renderer,
+            )
+            # forces all workers to start (and warm) now instead of on the first card
+            for _ in range(self.workers):
+                self._pool.submit(os.getpid)
+        except Exception as e:
+            log.warning("Render pool unavailable (%s); rendering on threads", e)
+            self._pool = None
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def render(
+        self,
+        spec: CardSpec,
+        avatar_bytes: Optional[bytes] = None,
+        avatar_rgba: Optional[bytes] = None,
+        encoding: CardEncoding = CardEncoding(),
+    ) -> RenderedCard:
+        pool = self._pool
+        if pool is not None:
+            try:
+                return await asyncio.get_running_loop().run_in_executor(
+                    pool, render_card, spec, avatar_bytes, avatar_rgba, encoding
+                )
+            except BrokenProcessPool as e:
+                log.error("Render pool broke (%s); falling back to thread rendering", e)
+                if self._pool is pool:
+                    self.close()
+        return await asyncio.to_thread(render_card, spec, avatar_bytes, avatar_rgba, encoding)
@@ -0,0 +1,322 @@
+"""
+Licenses worksheet writer for cogs/license_webhook.py, fed from the store's Sheets outbox.
+"""
+from __future__ import annotations
+
+import time
+import logging
+import asyncio
+import re
+import hashlib
+from datetime import datetime
+from typing import Callable, Optional
+
+import gspread
+
+from license_metrics import METRICS
+from license_store import LicenseStore
+
+log = logging.getLogger("license-bot")
+
+
+SHEET_HEADER = [
+    "Discord ID",
+    "Roblox Username",
+    "Roblox Display",
+    "Roleplay Name",
+    "License Number",
+    "License Type",
+    "License Code",
+    "Issued (UTC)",
+    "Expires (UTC)",
+    "Last Updated (UTC)",
+]
+
+
+def sheet_row(license_info: dict, updated_at: str) -> list[str]:
+    return [
+        str(license_info.get("discord_id", "")).strip(),
+        str(license_info.get("roblox_username", "") or ""),
+        str(license_info.get("roblox_display", "") or ""),
+        str(license_info.get("roleplay_name", "") or ""),
+        str(license_info.get("license_number", "") or ""),
+        str(license_info.get("license_type", "") or ""),
+        str(license_info.get("license_code", "") or ""),
+        str(license_info.get("issued_at", "") or ""),
+        str(license_info.get("expires_at", "") or ""),
+        updated_at,
+    ]
+
+
+def sheet_row_digest(row: list) -> str:
+    """Hash of a row's license fields (A:I); "Last Updated" is ignored so unchanged rows compare equal."""
+    cells = [str(v).strip() for v in list(row[:9]) + [""] * (9 - len(row[:9]))]
+    return hashlib.sha1("\x1f".join(cells).encode("utf-8")).hexdigest()
+
+
+class LicenseSheetWriter:
+    """
+    Single background writer for the Licenses worksheet, draining the durable
+    `sheet_outbox` table (one row per Discord ID, retried with backoff).
+    """
+
+    CELL_ROW_RE = re.compile(r"^[A-Z]+(\d+)$")
+
+    RETRY_BASE = 5.0
+    RETRY_CAP = 900.0
+    # pause after an unexpected error (e.g. the outbox query failing) before the next pass
+    LOOP_ERROR_DELAY = 30.0
+
+    def __init__(
+        self,
+        store: "LicenseStore",
+        open_worksheet: Callable[[], gspread.Worksheet],
+        flush_interval: float,
+        resync_interval: float = 3600.0,
+        batch_size: int = 200,
+    ):
+        self.store = store
+        self._open_worksheet = open_worksheet
+        self.flush_interval = flush_interval
+        self.resync_interval = resync_interval
+        self.batch_size = batch_size
+        self._ws: Optional[gspread.Worksheet] = None
+        self._row_of: Optional[dict[str, int]] = None
+        self._indexed_at = 0.0
+        self.index_resyncs = 0
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # one Sheets operation at a time (outbox flushes and reconciles share the row index)
+        self._sheet_lock = asyncio.Lock()
+        self.rows_written = 0
+
+        # refreshed after every drain pass; read by /metrics
+        self.depth = 0
+        self.oldest_enqueued_at: Optional[float] = None
+
+    @property
+    def oldest_age(self) -> float:
+        return time.time() - self.oldest_enqueued_at if self.oldest_enqueued_at else 0.0
+
+    def notify(self):
+        """New rows were committed to the outbox."""
+        self._wake.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        # anything still queued stays in the outbox and is replayed on next start
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _refresh_stats(self) -> Optional[float]:
+        self.depth, self.oldest_enqueued_at, next_due = await self.store.sheet_outbox_stats()
+        return next_due
+
+    async def _run(self):
+        try:
+            await asyncio.to_thread(self._connect)
+        except Exception as e:
+            log.warning("[Sheets] initial connect/index failed (will retry on first flush): %s", e)
+
+        try:
+            next_due = await self._refresh_stats()
+            if self.depth:
+                log.info("[Sheets] replaying %s pending outbox rows", self.depth)
+                self._wake.set()
+        except Exception:
+            log.exception("[Sheets] reading outbox stats failed; retrying in %ss", self.LOOP_ERROR_DELAY)
+            next_due = time.time() + self.LOOP_ERROR_DELAY
+
+        while True:
+            timeout = None if next_due is None else max(0.0, next_due - time.time())
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            # let the burst accumulate, then write it in one go
+            await asyncio.sleep(self.flush_interval)
+            self._wake.clear()
+
+            try:
+                while await self._flush() == self.batch_size:
+                    pass
+                next_due = await self._refresh_stats()
+            except Exception:
+                log.exception("[Sheets] outbox pass failed; retrying in %ss", self.LOOP_ERROR_DELAY)
+                next_due = time.time() + self.LOOP_ERROR_DELAY
+
+    async def _flush(self) -> int:
+        due = await self.store.due_sheet_rows(self.batch_size)
+        if not due:
+            return 0
+
+        batch = {discord_id: info for discord_id, info, _, _ in due}
+        try:
+            async with self._sheet_lock:
+                with METRICS.time("sheets"):
+                    await asyncio.to_thread(self._write_batch, batch)
+        except Exception as e:
+            # re-authorize / reopen and rebuild the row index on the next attempt
+            self._ws = None
+            self._row_of = None
+            now = time.time()
+            await self.store.sheet_rows_failed(
+                [
+                    (discord_id, now + min(self.RETRY_CAP, self.RETRY_BASE * (2 ** min(attempts, 10))))
+                    for discord_id, _, _, attempts in due
+                ],
+                str(e),
+            )
+            log.warning(
+                "[Sheets] batch of %s failed (max attempt %s): %s",
+                len(due), max(attempts for _, _, _, attempts in due) + 1, e,
+            )
+            return 0
+
+        await self.store.sheet_rows_done([(discord_id, seq) for discord_id, _, seq, _ in due])
+        self.rows_written += len(due)
+        log.info("[Sheets] upserted %s license rows", len(due))
+        return len(due)
+
+    def _connect(self) -> gspread.Worksheet:
+        if self._ws is None:
+            self._ws = self._open_worksheet()
+        if self._row_of is None or time.monotonic() - self._indexed_at > self.resync_interval:
+            self._load_index()
+        return self._ws
+
+    def _load_index(self):
+        # Discord ID -> sheet row from one column read; appends extend it from
+        # their response, so upserts never rescan column A
+        col_a = self._ws.col_values(1)
+        row_of: dict[str, int] = {}
+        for idx, val in enumerate(col_a[1:], start=2):
+            row_of.setdefault(str(val).strip(), idx)
+        self._row_of = row_of
+        self._indexed_at = time.monotonic()
+        self.index_resyncs += 1
+        log.info("[Sheets] indexed %s license rows", len(row_of))
+
+    def _verify_targets(self, targets: dict[str, int]) -> bool:
+        got = self._ws.batch_get([f"A{idx}" for idx in targets.values()])
+        for (discord_id, idx), value_range in zip(targets.items(), got):
+            cell = str(value_range[0][0]).strip() if value_range and value_range[0] else ""
+            if cell != discord_id:
+                log.warning("[Sheets] row index stale: A%s is %r, expected %s; resyncing", idx, cell, discord_id)
+                return False
+        return True
+
+    def _write_batch(self, batch: dict[str, dict]):
+        self._connect()
+
+        # read the target A cells back first; rows moved or deleted by hand force a resync
+        targets = {d: self._row_of[d] for d in batch if d in self._row_of}
+        if targets and not self._verify_targets(targets):
+            self._load_index()
+            targets = {d: self._row_of[d] for d in batch if d in self._row_of}
+
+        now_utc = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+        updates = []
+        appends = []
+        for discord_id, info in batch.items():
+            row = sheet_row(info, now_utc)
+            idx = targets.get(discord_id)
+            if idx is None:
+                appends.append(row)
+            else:
+                updates.append({"range": f"A{idx}:J{idx}", "values": [row]})
+
+        self._apply(updates, appends)
+
+    async def reconcile(self) -> dict[str, int]:
+        """
+        Rewrite only the sheet rows whose field hash differs from the licenses
+        table; sheet rows with no local license are counted as orphaned, not touched.
+        """
+        local = await self.store.licenses_for_sheet()
+        async with self._sheet_lock:
+            try:
+                return await asyncio.to_thread(self._reconcile, local)
+            except Exception:
+                self._ws = None
+                self._row_of = None
+                raise
+
+    def _reconcile(self, local: dict[str, dict]) -> dict[str, int]:
+        if self._ws is None:
+            self._ws = self._open_worksheet()
+        values = self._ws.get_all_values()
+
+        row_of: dict[str, int] = {}
+        digest_of: dict[str, str] = {}
+        duplicates = 0
+        for idx, row in enumerate(values[1:], start=2):
+            discord_id = str(row[0]).strip() if row else ""
+            if not discord_id:
+                continue
+            if discord_id in row_of:
+                duplicates += 1
+                continue
+            row_of[discord_id] = idx
+            digest_of[discord_id] = sheet_row_digest(row)
+
+        # the full read is also a fresh row index
+        self._row_of = row_of
+        self._indexed_at = time.monotonic()
+        self.index_resyncs += 1
+
+        now_utc = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        updates = []
+        appends = []
+        for discord_id, info in local.items():
+            row = sheet_row(info, now_utc)
+            idx = row_of.get(discord_id)
+            if idx is None:
+                appends.append(row)
+            elif digest_of[discord_id] != sheet_row_digest(row):
+                updates.append({"range": f"A{idx}:J{idx}", "values": [row]})
+
+        self._apply(updates, appends)
+        self.rows_written += len(updates) + len(appends)
+
+        return {
+            "checked": len(local),
+            "added": len(appends),
+            "changed": len(updates),
+            "unchanged": len(local) - len(appends) - len(updates),
+            "orphaned": sum(1 for d in row_of if d not in local),
+            "duplicates": duplicates,
+        }
+
+    def _apply(self, updates: list[dict], appends: list[list[str]]):
+        # RAW: cells hold exactly the strings sheet_row built, so get_all_values()
+        # reads back what reconcile hashes (USER_ENTERED would re-parse dates/numbers)
+        ws = self._ws
+        if updates:
+            ws.batch_update(updates, value_input_option="RAW")
+        if appends:
+            resp = ws.append_rows(appends, value_input_option="RAW")
+            start = self._appended_start_row(resp)
+            if start is None:
+                # can't tell where the rows landed; rebuild the index next flush
+                self._row_of = None
+            else:
+                for offset, row in enumerate(appends):
+                    self._row_of[row[0]] = start + offset
+
+    @classmethod
+    def _appended_start_row(cls, resp) -> Optional[int]:
+        try:
+            updated_range = resp["updates"]["updatedRange"]
+        except (KeyError, TypeError):
+            return None
+        # e.g. "Licenses!A42:J44" -> 42
+        first_cell = updated_range.rsplit("!", 1)[-1].split(":")[0]
+        m = cls.CELL_ROW_RE.match(first_cell)
+        return int(m.group(1)) if m else None
@@ -0,0 +1,505 @@
+"""
+workforce.db access for cogs/license_webhook.py: licenses, jobs and the Sheets outbox.
+"""
+from __future__ import annotations
+
+import json
+import time
+import logging
+import asyncio
+import hashlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+import aiosqlite
+
+
+log = logging.getLogger("license-bot")
+
+
+class LicenseStore:
+    """
+    workforce.db over one long-lived aiosqlite connection (WAL), opened and
+    migrated at cog load; license upserts are group-committed.
+    """
+
+    LICENSE_COLUMNS = (
+        "discord_id",
+        "roblox_username",
+        "roblox_display",
+        "roleplay_name",
+        "age",
+        "address",
+        "eye_color",
+        "height",
+        "license_number",
+        "issued_at",
+        "expires_at",
+        "license_type",
+        "license_code",
+    )
+
+    UPSERT_LICENSE_SQL = """
+        INSERT INTO licenses (
+            discord_id,
+            roblox_username,
+            roblox_display,
+            roleplay_name,
+            age,
+            address,
+            eye_color,
+            height,
+            license_number,
+            issued_at,
+            expires_at,
+            license_type,
+            license_code
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(discord_id) DO UPDATE SET
+            roblox_username = excluded.roblox_username,
+            roblox_display  = excluded.roblox_display,
+            roleplay_name   = excluded.roleplay_name,
+            age             = excluded.age,
+            address         = excluded.address,
+            eye_color       = excluded.eye_color,
+            height          = excluded.height,
+            license_number  = excluded.license_number,
+            issued_at       = excluded.issued_at,
+            expires_at      = excluded.expires_at,
+            license_type    = excluded.license_type,
+            license_code    = excluded.license_code,
+            expiry_handled_at = NULL
+    """
+
+    ENQUEUE_SHEET_SQL = """
+        INSERT INTO sheet_outbox (discord_id, payload, enqueued_at)
+        VALUES (?, ?, ?)
+        ON CONFLICT(discord_id) DO UPDATE SET
+            payload = excluded.payload,
+            seq     = sheet_outbox.seq + 1
+    """
+
+    def __init__(self, path: str, flush_window: float = 0.01, batch_size: int = 100):
+        self.path = path
+        self.flush_window = flush_window
+        self.batch_size = batch_size
+        self.db: Optional[aiosqlite.Connection] = None
+
+        self._pending: list[tuple[tuple, Optional[dict], asyncio.Future]] = []
+        self._wake = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        self.batches_committed = 0
+        self.rows_committed = 0
+
+    async def open(self):
+        if self.db is not None:
+            return
+        self.db = await aiosqlite.connect(self.path)
+        await self.db.execute("PRAGMA journal_mode=WAL;")
+        # NORMAL is durable across app crashes in WAL mode; only an OS crash can drop the last commits
+        await self.db.execute("PRAGMA synchronous=NORMAL;")
+        await self.db.execute("PRAGMA cache_size=-16000;")  # ~16 MB page cache
+        await self.db.execute("PRAGMA temp_store=MEMORY;")
+        await self.db.execute("PRAGMA busy_timeout=5000;")
+        await self._ensure_schema()
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        while self._pending:
+            await self._commit_next_batch()
+        if self.db is not None:
+            await self.db.close()
+            self.db = None
+
+    async def _ensure_schema(self):
+        db = self.db
+        await db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS licenses (
+                discord_id TEXT PRIMARY KEY,
+                roblox_username TEXT,
+                roblox_display TEXT,
+                roleplay_name TEXT,
+                age TEXT,
+                address TEXT,
+                eye_color TEXT,
+                height TEXT,
+                license_number TEXT,
+                issued_at TEXT,
+                expires_at TEXT
+            )
+            """
+        )
+
+        async with db.execute("PRAGMA table_info(licenses)") as cur:
+            cols = {row[1] for row in await cur.fetchall()}
+
+        if "license_type" not in cols:
+            await db.execute("ALTER TABLE licenses ADD COLUMN license_type TEXT")
+        if "license_code" not in cols:
+            await db.execute("ALTER TABLE licenses ADD COLUMN license_code TEXT")
+        if "expiry_handled_at" not in cols:
+            await db.execute("ALTER TABLE licenses ADD COLUMN expiry_handled_at TEXT")
+
+        # only licenses still waiting to expire are indexed; handled rows drop out
+        await db.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_licenses_expiry
+            ON licenses(expires_at) WHERE expiry_handled_at IS NULL
+            """
+        )
+
+        await db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS license_jobs (
+                job_id TEXT PRIMARY KEY,
+                discord_id TEXT,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL,
+                error TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+            """
+        )
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_license_jobs_state ON license_jobs(state)")
+
+        # pending Google Sheets upserts, one per Discord ID (newest payload wins; seq bumps on replace)
+        await db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sheet_outbox (
+                discord_id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                seq INTEGER NOT NULL DEFAULT 1,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                enqueued_at REAL NOT NULL,
+                last_error TEXT
+            )
+            """
+        )
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_sheet_outbox_due ON sheet_outbox(next_attempt_at)")
+        await db.commit()
+
+    # ---- licenses (group commit) ----
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def upsert_license(self, record: tuple, sheet_info: Optional[dict] = None):
+        """
+        Queue an upsert and wait until the batch containing it has committed.
+        `sheet_info` is put in the Sheets outbox in the same transaction.
+        """
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((record, sheet_info, fut))
+        self._wake.set()
+        if len(self._pending) >= self.batch_size:
+            self._batch_full.set()
+        await fut
+
+    async def _flush_loop(self):
+        # group commit: buffer callers for up to `flush_window` (or until
+        # `batch_size` are waiting), then one executemany + commit per batch
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            if len(self._pending) < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._batch_full.wait(), timeout=self.flush_window)
+                except asyncio.TimeoutError:
+                    pass
+            self._batch_full.clear()
+
+            while self._pending:
+                await self._commit_next_batch()
+
+    async def _write_rows(self, batch: list):
+        # rows for the same discord_id within a batch apply in arrival order (last one wins)
+        await self.db.executemany(self.UPSERT_LICENSE_SQL, [record for record, _, _ in batch])
+        now = time.time()
+        outbox = [
+            (str(info["discord_id"]), json.dumps(info), now)
+            for _, info, _ in batch
+            if info is not None
+        ]
+        if outbox:
+            await self.db.executemany(self.ENQUEUE_SHEET_SQL, outbox)
+        await self.db.commit()
+        self.batches_committed += 1
+        self.rows_committed += len(batch)
+
+    async def _rollback(self):
+        try:
+            await self.db.rollback()
+        except Exception:
+            pass
+
+    async def _commit_next_batch(self):
+        batch = self._pending[: self.batch_size]
+        del self._pending[: self.batch_size]
+        try:
+            await self._write_rows(batch)
+            done = [(fut, None) for _, _, fut in batch]
+        except Exception as e:
+            await self._rollback()
+            if len(batch) == 1:
+                log.error("[DB] license upsert failed: %s", e)
+                done = [(batch[0][2], e)]
+            else:
+                # retry row by row so one bad record only fails its own caller
+                log.warning("[DB] license batch of %s failed (%s); retrying rows individually", len(batch), e)
+                done = []
+                for item in batch:
+                    try:
+                        await self._write_rows([item])
+                        done.append((item[2], None))
+                    except Exception as row_error:
+                        log.error("[DB] license upsert for %s failed: %s", item[0][0], row_error)
+                        await self._rollback()
+                        done.append((item[2], row_error))
+
+        for fut, error in done:
+            if fut.done():
+                continue
+            if error is None:
+                fut.set_result(None)
+            else:
+                fut.set_exception(error)
+
+    # ---- sheets outbox ----
+    async def due_sheet_rows(self, limit: int) -> list[tuple[str, dict, int, int]]:
+        """(discord_id, info, seq, attempts) for entries whose backoff has elapsed, oldest first."""
+        async with self.db.execute(
+            """
+            SELECT discord_id, payload, seq, attempts FROM sheet_outbox
+            WHERE next_attempt_at <= ?
+            ORDER BY enqueued_at
+            LIMIT ?
+            """,
+            (time.time(), limit),
+        ) as cur:
+            rows = await cur.fetchall()
+        return [(d, json.loads(p), seq, attempts) for d, p, seq, attempts in rows]
+
+    async def sheet_rows_done(self, done: list[tuple[str, int]]):
+        # only delete the version we wrote; a newer submission (seq bumped) stays queued
+        await self.db.executemany("DELETE FROM sheet_outbox WHERE discord_id = ? AND seq = ?", done)
+        await self.db.commit()
+
+    async def sheet_rows_failed(self, failed: list[tuple[str, float]], error: str):
+        await self.db.executemany(
+            """
+            UPDATE sheet_outbox
+            SET attempts = attempts + 1, next_attempt_at = ?, last_error = ?
+            WHERE discord_id = ?
+            """,
+            [(next_at, error[:500], discord_id) for discord_id, next_at in failed],
+        )
+        await self.db.commit()
+
+    async def sheet_outbox_stats(self) -> tuple[int, Optional[float], Optional[float]]:
+        """(depth, enqueued_at of the oldest entry, earliest next_attempt_at)."""
+        async with self.db.execute(
+            "SELECT COUNT(*), MIN(enqueued_at), MIN(next_attempt_at) FROM sheet_outbox"
+        ) as cur:
+            depth, oldest, next_due = await cur.fetchone()
+        return depth, oldest, next_due
+
+    async def licenses_for_sheet(self) -> dict[str, dict]:
+        """Every stored license as a sheet_row() info dict, keyed by Discord ID."""
+        async with self.db.execute(
+            """
+            SELECT discord_id, roblox_username, roblox_display, roleplay_name, license_number,
+                   license_type, license_code, issued_at, expires_at
+            FROM licenses
+            """
+        ) as cur:
+            rows = await cur.fetchall()
+
+        def sheet_time(value: Optional[str]) -> str:
+            # stored as isoformat, written to the sheet as "%Y-%m-%d %H:%M:%S"
+            try:
+                return datetime.fromisoformat(value).strftime("%Y-%m-%d %H:%M:%S")
+            except (TypeError, ValueError):
+                return value or ""
+
+        return {
+            str(r[0]): {
+                "discord_id": str(r[0]),
+                "roblox_username": r[1],
+                "roblox_display": r[2],
+                "roleplay_name": r[3],
+                "license_number": r[4],
+                "license_type": r[5],
+                "license_code": r[6],
+                "issued_at": sheet_time(r[7]),
+                "expires_at": sheet_time(r[8]),
+            }
+            for r in rows
+        }
+
+    async def get_licenses(self, discord_ids: list[str]) -> dict[str, dict]:
+        """Stored licenses for the given IDs (missing IDs are simply absent)."""
+        found: dict[str, dict] = {}
+        # stay well under SQLite's bound-parameter limit
+        for i in range(0, len(discord_ids), 500):
+            chunk = discord_ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            async with self.db.execute(
+                f"SELECT {', '.join(self.LICENSE_COLUMNS)} FROM licenses WHERE discord_id IN ({placeholders})",
+                chunk,
+            ) as cur:
+                for row in await cur.fetchall():
+                    found[str(row[0])] = dict(zip(self.LICENSE_COLUMNS, row))
+        return found
+
+    # ---- expiry ----
+    async def expiring_before(self, until: str, limit: int) -> list[tuple[str, str]]:
+        """(discord_id, expires_at) for unhandled licenses expiring at or before `until`, soonest first."""
+        async with self.db.execute(
+            """
+            SELECT discord_id, expires_at FROM licenses
+            WHERE expiry_handled_at IS NULL AND expires_at <= ?
+            ORDER BY expires_at
+            LIMIT ?
+            """,
+            (until, limit),
+        ) as cur:
+            return await cur.fetchall()
+
+    async def confirm_expired(self, discord_ids: list[str], now: str) -> list[tuple[str, str, str]]:
+        """
+        (discord_id, license_type, expires_at) for the given IDs that are still
+        expired and unhandled; a re-issue since they were loaded drops them.
+        """
+        placeholders = ",".join("?" * len(discord_ids))
+        async with self.db.execute(
+            f"""
+            SELECT discord_id, license_type, expires_at FROM licenses
+            WHERE discord_id IN ({placeholders})
+              AND expiry_handled_at IS NULL AND expires_at <= ?
+            """,
+            (*discord_ids, now),
+        ) as cur:
+            return await cur.fetchall()
+
+    async def mark_expiry_handled(self, handled: list[tuple[str, str]]):
+        # keyed on expires_at too, so a license re-issued meanwhile is not marked
+        now = datetime.utcnow().isoformat()
+        await self.db.executemany(
+            "UPDATE licenses SET expiry_handled_at = ? WHERE discord_id = ? AND expires_at = ?",
+            [(now, discord_id, expires_at) for discord_id, expires_at in handled],
+        )
+        await self.db.commit()
+
+    # ---- jobs ----
+    async def requeue_interrupted_jobs(self) -> list[str]:
+        # jobs interrupted mid-render by a restart are picked up again from the start
+        await self.db.execute("UPDATE license_jobs SET state = 'queued' WHERE state = 'rendering'")
+        await self.db.commit()
+        async with self.db.execute(
+            "SELECT job_id FROM license_jobs WHERE state = 'queued' ORDER BY created_at"
+        ) as cur:
+            return [row[0] for row in await cur.fetchall()]
+
+    async def insert_job(self, job_id: str, discord_id: str, payload: str):
+        now = datetime.utcnow().isoformat()
+        await self.db.execute(
+            """
+            INSERT INTO license_jobs (job_id, discord_id, payload, state, created_at, updated_at)
+            VALUES (?, ?, ?, 'queued', ?, ?)
+            """,
+            (job_id, discord_id, payload, now, now),
+        )
+        await self.db.commit()
+
+    async def set_job_state(self, job_id: str, state: str, error: Optional[str] = None):
+        await self.db.execute(
+            "UPDATE license_jobs SET state = ?, error = ?, updated_at = ? WHERE job_id = ?",
+            (state, error, datetime.utcnow().isoformat(), job_id),
+        )
+        await self.db.commit()
+
+    async def get_job(self, job_id: str) -> Optional[dict]:
+        async with self.db.execute(
+            """
+            SELECT job_id, discord_id, state, error, created_at, updated_at
+            FROM license_jobs WHERE job_id = ?
+            """,
+            (job_id,),
+        ) as cur:
+            row = await cur.fetchone()
+        if not row:
+            return None
+        keys = ("job_id", "discord_id", "state", "error", "created_at", "updated_at")
+        return dict(zip(keys, row))
+
+    async def get_job_payload(self, job_id: str) -> Optional[str]:
+        async with self.db.execute("SELECT payload FROM license_jobs WHERE job_id = ?", (job_id,)) as cur:
+            row = await cur.fetchone()
+        return row[0] if row else None
+
+
+class LicenseReadCache:
+    """
+    LRU of license records (and misses) in front of the licenses table for the
+    read API, each with an ETag over its JSON so pollers can revalidate for free.
+
+    The cog calls `invalidate()` after every upsert. Reads that raced with an
+    invalidation are served but not cached, so a stale row never sticks.
+    """
+
+    def __init__(self, store: LicenseStore, capacity: int):
+        self.store = store
+        self.capacity = capacity
+        # discord_id -> (record or None, etag or None)
+        self._entries: OrderedDict[str, tuple[Optional[dict], Optional[str]]] = OrderedDict()
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def etag(record: dict) -> str:
+        body = json.dumps(record, sort_keys=True, separators=(",", ":"))
+        return '"' + hashlib.sha1(body.encode("utf-8")).hexdigest() + '"'
+
+    def invalidate(self, discord_id: str):
+        self._entries.pop(str(discord_id), None)
+        self._version += 1
+
+    async def get_many(self, discord_ids: list[str]) -> dict[str, tuple[Optional[dict], Optional[str]]]:
+        out: dict[str, tuple[Optional[dict], Optional[str]]] = {}
+        missing = []
+        for discord_id in dict.fromkeys(discord_ids):
+            entry = self._entries.get(discord_id)
+            if entry is None:
+                missing.append(discord_id)
+                continue
+            self._entries.move_to_end(discord_id)
+            out[discord_id] = entry
+        self.hits += len(out)
+        if not missing:
+            return out
+
+        self.misses += len(missing)
+        version = self._version
+        found = await self.store.get_licenses(missing)
+        for discord_id in missing:
+            record = found.get(discord_id)
+            entry = (record, self.etag(record) if record is not None else None)
+            out[discord_id] = entry
+            if self._version == version:
+                self._entries[discord_id] = entry
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+        return out
+
+    async def get(self, discord_id: str) -> tuple[Optional[dict], Optional[str]]:
+        return (await self.get_many([discord_id]))[discord_id]
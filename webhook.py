@@ -1,38 +1,125 @@
 import os
+import time
 import asyncio
+from typing import Optional
 import aiohttp
-from flask import Flask, request, jsonify
-
-app = Flask(__name__)
-
-# --- Bloxlink API Request ---
-async def get_bloxlink_info(discord_id: int, guild_id: int):
-    """Fetch Roblox ID + username from Bloxlink API"""
-    url = f"https://api.blox.link/v4/public/guilds/{guild_id}/discord-to-roblox/{discord_id}"
-    headers = {"Accept": "application/json", "User-Agent": "LicenseWebhook/1.0"}
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=headers) as resp:
-            if resp.status == 200:
-                data = await resp.json()
-                rid = data.get("robloxID")
-                username = data.get("resolved", {}).get("roblox", {}).get("username")
-                return rid, username
-            return None, None
+from aiohttp import web
+from bloxlink_client import BloxlinkClient
+
+# Served with aiohttp on one event loop:
+#   python webhook.py
+#   gunicorn webhook:app --worker-class aiohttp.GunicornWebWorker
+
+BLOXLINK_URL = "https://api.blox.link/v4/public/guilds/{guild_id}/discord-to-roblox/{discord_id}"
+
+# Discord -> Roblox mappings; unlinked users are cached for a shorter time
+POSITIVE_TTL = float(os.getenv("BLOXLINK_CACHE_TTL", "600"))
+NEGATIVE_TTL = float(os.getenv("BLOXLINK_NEGATIVE_TTL", "60"))
+CACHE_SIZE = int(os.getenv("BLOXLINK_CACHE_SIZE", "10000"))
+
+# shared upstream budget; a 429 pauses every lookup for its Retry-After
+RATE_PER_SEC = float(os.getenv("BLOXLINK_RATE_PER_SEC", "5"))
+RATE_BURST = float(os.getenv("BLOXLINK_BURST", "10"))
+
+BATCH_CONCURRENCY = int(os.getenv("BLOXLINK_BATCH_CONCURRENCY", "8"))
+BATCH_MAX_IDS = int(os.getenv("BLOXLINK_BATCH_MAX_IDS", "500"))
+
+
+class BloxlinkError(Exception):
+    """Bloxlink answered with something other than a mapping or "not linked"."""
+
+
+class BloxlinkResolver:
+    """
+    Discord -> Roblox lookups over one shared ClientSession (keep-alive, one TLS
+    handshake) with a TTL cache. "Not linked" answers are cached too (for
+    NEGATIVE_TTL); upstream errors are not. Cache misses go through
+    BloxlinkClient, so concurrent misses for one (guild, discord_id) share a
+    single request.
+    """
+
+    def __init__(self, client: BloxlinkClient, positive_ttl: float, negative_ttl: float, max_entries: int):
+        self.client = client
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        # (guild_id, discord_id) -> (expires_at, (roblox_id, username) or None)
+        self._cache: dict[tuple[int, int], tuple[float, Optional[tuple[str, str]]]] = {}
+
+    def _cached(self, key: tuple[int, int]):
+        entry = self._cache.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._cache[key]
+            return False, None
+        return True, value
+
+    def _store(self, key: tuple[int, int], value: Optional[tuple[str, str]]):
+        if len(self._cache) >= self.max_entries:
+            # drop expired entries first, then the oldest inserted
+            now = time.monotonic()
+            for k in [k for k, (exp, _) in self._cache.items() if exp < now]:
+                del self._cache[k]
+            while len(self._cache) >= self.max_entries:
+                del self._cache[next(iter(self._cache))]
+        ttl = self.positive_ttl if value is not None else self.negative_ttl
+        self._cache[key] = (time.monotonic() + ttl, value)
+
+    async def resolve(self, discord_id: int, guild_id: int) -> Optional[tuple[str, str]]:
+        """(roblox_id, username), or None if the user has no linked account. Raises on upstream errors."""
+        key = (guild_id, discord_id)
+        hit, value = self._cached(key)
+        if hit:
+            return value
+        value = await self._fetch(discord_id, guild_id)
+        self._store(key, value)
+        return value
+
+    async def _fetch(self, discord_id: int, guild_id: int) -> Optional[tuple[str, str]]:
+        url = BLOXLINK_URL.format(guild_id=guild_id, discord_id=discord_id)
+        headers = {"Accept": "application/json", "User-Agent": "LicenseWebhook/1.0"}
+        status, data = await self.client.get((guild_id, discord_id), url, headers)
+        if status == 200 and isinstance(data, dict):
+            rid = data.get("robloxID")
+            username = data.get("resolved", {}).get("roblox", {}).get("username")
+            return (rid, username) if rid else None
+        if status == 404:
+            return None
+        raise BloxlinkError(f"Bloxlink returned HTTP {status}")
+
+
+RESOLVER = web.AppKey("resolver", BloxlinkResolver)
+
+
+def _resolver(request: web.Request) -> BloxlinkResolver:
+    return request.app[RESOLVER]
+
 
 # --- Webhook Endpoint ---
-@app.route("/webhook", methods=["POST"])
-def webhook():
-    data = request.json or {}
+async def webhook(request: web.Request):
+    try:
+        data = await request.json()
+    except Exception:
+        data = None
+    data = data if isinstance(data, dict) else {}
     discord_id = data.get("discord_id")
     guild_id = data.get("guild_id")
 
     if not discord_id or not guild_id:
-        return jsonify({"error": "Missing discord_id or guild_id"}), 400
+        return web.json_response({"error": "Missing discord_id or guild_id"}, status=400)
 
     # Fetch Bloxlink info
-    rid, username = asyncio.run(get_bloxlink_info(int(discord_id), int(guild_id)))
-    if not rid:
-        return jsonify({"error": "No linked Roblox account"}), 404
+    try:
+        linked = await _resolver(request).resolve(int(discord_id), int(guild_id))
+    except ValueError:
+        return web.json_response({"error": "discord_id and guild_id must be numeric"}, status=400)
+    except (aiohttp.ClientError, asyncio.TimeoutError, BloxlinkError) as e:
+        return web.json_response({"error": f"Bloxlink lookup failed: {e}"}, status=502)
+    if not linked:
+        return web.json_response({"error": "No linked Roblox account"}, status=404)
+    rid, username = linked
 
     # Log and respond
     print(f"✅ Discord {discord_id} → Roblox {username} ({rid})")
@@ -41,16 +128,74 @@ def webhook():
     # e.g., POST to another internal endpoint
     # requests.post("https://my-discord-bot.onrender.com/license", json={"roblox_id": rid, "username": username})
 
-    return jsonify({
+    return web.json_response({
         "status": "ok",
         "discord_id": discord_id,
         "roblox_id": rid,
         "roblox_username": username
-    }), 200
+    })
+
+
+# --- Batch Endpoint ---
+async def webhook_batch(request: web.Request):
+    """
+    POST /webhook/batch {"guild_id": ..., "discord_ids": [...]}
+    Duplicate IDs are looked up once; at most BATCH_CONCURRENCY lookups run at a time.
+    """
+    try:
+        data = await request.json()
+    except Exception:
+        data = None
+    data = data if isinstance(data, dict) else {}
+    guild_id = data.get("guild_id")
+    ids = data.get("discord_ids")
+
+    if not guild_id or not isinstance(ids, list) or not ids:
+        return web.json_response({"error": "Missing guild_id or discord_ids"}, status=400)
+    if len(ids) > BATCH_MAX_IDS:
+        return web.json_response({"error": f"At most {BATCH_MAX_IDS} discord_ids per request"}, status=413)
+    try:
+        guild_id = int(guild_id)
+        unique = list(dict.fromkeys(int(i) for i in ids))
+    except (TypeError, ValueError):
+        return web.json_response({"error": "discord_ids and guild_id must be numeric"}, status=400)
+
+    resolver = _resolver(request)
+    sem = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def one(discord_id: int) -> dict:
+        async with sem:
+            try:
+                linked = await resolver.resolve(discord_id, guild_id)
+            except (aiohttp.ClientError, asyncio.TimeoutError, BloxlinkError) as e:
+                return {"discord_id": str(discord_id), "status": "error", "error": f"Bloxlink lookup failed: {e}"}
+        if not linked:
+            return {"discord_id": str(discord_id), "status": "not_linked"}
+        rid, username = linked
+        return {"discord_id": str(discord_id), "status": "ok", "roblox_id": rid, "roblox_username": username}
+
+    results = await asyncio.gather(*(one(i) for i in unique))
+    return web.json_response({"status": "ok", "results": results})
+
+
+async def health(request: web.Request):
+    return web.Response(text="OK")
+
+
+async def _bloxlink_session(app: web.Application):
+    timeout = aiohttp.ClientTimeout(total=float(os.getenv("BLOXLINK_TIMEOUT", "10")))
+    connector = aiohttp.TCPConnector(limit=int(os.getenv("BLOXLINK_MAX_CONNECTIONS", "32")), ttl_dns_cache=300)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        client = BloxlinkClient(session, rate=RATE_PER_SEC, burst=RATE_BURST)
+        app[RESOLVER] = BloxlinkResolver(client, POSITIVE_TTL, NEGATIVE_TTL, CACHE_SIZE)
+        yield
+
 
-@app.route("/health")
-def health():
-    return "OK", 200
+app = web.Application()
+app.cleanup_ctx.append(_bloxlink_session)
+app.router.add_post("/webhook", webhook)
+app.router.add_post("/webhook/batch", webhook_batch)
+app.router.add_get("/health", health)
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=10000)
+    web.run_app(app, host="0.0.0.0", port=10000)